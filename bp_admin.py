@@ -1,18 +1,40 @@
-from flask import Blueprint, render_template, url_for
+from datetime import timedelta
+
+import click
+from flask import Blueprint, render_template, request, url_for
 from sqlalchemy import select
 
 from bp_auth import AuthActions, admin_required, auth
 from configs import CONSTS
-from models import Comment, Contact, Log, db
+from log_rollup import (
+    DIMENSIONS,
+    apply_log_indexes,
+    get_status_counts,
+    get_top_paths,
+    get_top_values,
+    get_traffic,
+    prune_logs,
+    rollup_logs,
+    truncate,
+    utc_now
+)
+from log_writer import log_writer
+from models import Comment, Contact, Log, LogRollupState, db
+from pagination import keyset_paginate
+from response_cache import response_cache
 
-bp_admin = Blueprint("bp_admin", __name__, template_folder="templates")
+bp_admin = Blueprint("bp_admin", __name__, template_folder="templates", cli_group="logs")
 
 
 @bp_admin.route("/admin_contacts", methods=["GET"])
 @admin_required
 def admin_contacts():
-    items = db.session.scalars(select(Contact).order_by(Contact.created_datetime.desc()).limit(30)).all()
-    attributes = ["name", "email", "message"]
+    cursor = request.args.get("cursor")
+    items, next_cursor = keyset_paginate(
+        db.session, select(Contact), Contact.created_datetime, Contact.id, cursor, CONSTS.admin_page_size
+    )
+    next_url = url_for("bp_admin.admin_contacts", cursor=next_cursor) if next_cursor else None
+    attributes = ["created_datetime", "name", "email", "message"]
     header = "Showing all site messages."
     return render_template(
         "admin_item.html",
@@ -21,6 +43,8 @@ def admin_contacts():
         safe_cols=[],
         attributes=attributes,
         header=header,
+        cursor=cursor,
+        next_url=next_url,
         is_admin=auth(AuthActions.is_admin),
     )
 
@@ -49,8 +73,9 @@ def admin_comments():
 @admin_required
 def admin_logs():
     items = db.session.scalars(select(Log).where(Log.path.not_like("/static%")).order_by(Log.id.desc()).limit(30)).all()
-    attributes = ["id", "start_datetime_utc", "duration", "method", "x_forwarded_for", "referrer", "path", "user_agent"]
-    header = "Showing all site logs."
+    attributes = ["id", "start_datetime_utc", "duration", "sql_count", "sql_duration", "template_duration", "method", "x_forwarded_for", "referrer", "path", "user_agent"]
+    stats = log_writer.stats()
+    header = f"Showing all site logs. This worker has {stats['buffered']} rows waiting to be written, and dropped {stats['dropped']}."
     return render_template(
         "admin_item.html",
         CONSTS=CONSTS,
@@ -60,3 +85,88 @@ def admin_logs():
         header=header,
         is_admin=auth(AuthActions.is_admin),
     )
+
+
+ANALYTICS_DAYS = (1, 7, 30, 90)
+
+
+@bp_admin.route("/admin_analytics", methods=["GET"])
+@admin_required
+def admin_analytics():
+    """Traffic from the log rollups, which stay small however many raw log rows there are."""
+    days = request.args.get("days", 7, type=int)
+    if days not in ANALYTICS_DAYS:
+        days = 7
+
+    # catch up on rows logged since the last cron run, a bounded amount of work
+    rollup_logs(db.session, max_batches=1)
+
+    if days == 1:
+        period, since = "hour", truncate(utc_now() - timedelta(hours=23), "hour")
+    else:
+        period, since = "day", truncate(utc_now() - timedelta(days=days - 1), "day")
+
+    limit = CONSTS.analytics_top_limit
+    return render_template(
+        "admin_analytics.html",
+        CONSTS=CONSTS,
+        days=days,
+        days_choices=ANALYTICS_DAYS,
+        period=period,
+        traffic=get_traffic(db.session, period, since),
+        top_paths=get_top_paths(db.session, since, limit),
+        status_counts=get_status_counts(db.session, since),
+        top_values={dimension: get_top_values(db.session, dimension, since, limit) for dimension in DIMENSIONS},
+        rolled_up_to=db.session.scalar(select(LogRollupState.updated_datetime)),
+        is_admin=auth(AuthActions.is_admin),
+    )
+
+
+@bp_admin.route("/admin_cache", methods=["GET"])
+@admin_required
+def admin_cache():
+    stats = response_cache.stats()
+    lookups = stats.get("hits", 0) + stats.get("misses", 0)
+    if lookups:
+        stats["hit_rate"] = f"{stats.get('hits', 0) / lookups:.1%}"
+
+    items = [{"name": "backend", "value": CONSTS.response_cache_backend or "disabled"}]
+    items += [{"name": name, "value": str(value)} for name, value in stats.items()]
+    attributes = ["name", "value"]
+    header = "Showing response cache counters."
+    if CONSTS.response_cache_backend == "memory":
+        header += " These are kept per worker process."
+    return render_template(
+        "admin_item.html",
+        CONSTS=CONSTS,
+        items=items,
+        safe_cols=[],
+        attributes=attributes,
+        header=header,
+        is_admin=auth(AuthActions.is_admin),
+    )
+
+
+@bp_admin.cli.command("rollup")
+def logs_rollup():
+    """Fold new log rows into the hourly and daily aggregates. Run it from cron, e.g. every few minutes."""
+    count = rollup_logs(db.session)
+    click.echo(f"Rolled up {count} log rows.")
+
+
+@bp_admin.cli.command("prune")
+@click.option("--days", type=int, help="Keep raw rows this many days, defaults to CONSTS.log_raw_retention_days.")
+@click.option("--archive-dir", type=click.Path(file_okay=False), help="Archive deleted rows here, defaults to CONSTS.log_archive_dir.")
+def logs_prune(days, archive_dir):
+    """Roll up, then delete raw log rows past retention, and hourly aggregates past theirs."""
+    rollup_logs(db.session)
+    count = prune_logs(db.session, raw_retention_days=days, archive_dir=archive_dir)
+    click.echo(f"Deleted {count} log rows.")
+
+
+@bp_admin.cli.command("indexes")
+def logs_indexes():
+    """Create the log indexes in CONSTS.log_indexes and drop the others."""
+    with db.engine.begin() as connection:
+        names = apply_log_indexes(connection)
+    click.echo(f"Log indexes: {', '.join(names) or 'none'}.")
@@ -1,10 +1,11 @@
 from enum import Enum
 from functools import wraps
+from time import time
 
 from flask import (
     Blueprint,
-    current_app,
     flash,
+    g,
     redirect,
     render_template,
     session,
@@ -13,7 +14,7 @@ from flask import (
 from sqlalchemy import select
 from werkzeug.security import check_password_hash
 
-from captcha import MathCaptcha
+from bp_captcha import math_captcha
 from configs import CONSTS
 from forms import LoginForm
 from limiter import limiter
@@ -30,29 +31,54 @@ class AuthActions(Enum):
     is_admin = 5
 
 
+def get_user_role(user_id):
+    """
+    Look up the role of `user_id` once per request, memoised in `g`.
+    With `CONSTS.session_role_cache_seconds`, the role is also kept in the (signed) session for that long.
+    """
+    if "user_role" in g:
+        return g.user_role
+
+    cached = session.get("role_cache")
+    if CONSTS.session_role_cache_seconds and cached and cached["user_id"] == user_id and cached["expires"] > time():
+        role = cached["role"]
+    else:
+        role = db.session.scalar(select(User.role).where(User.id == user_id))
+        if CONSTS.session_role_cache_seconds and role is not None:
+            session["role_cache"] = {"user_id": user_id, "role": role, "expires": time() + CONSTS.session_role_cache_seconds}
+
+    g.user_role = role
+    return role
+
+
+def clear_role_cache():
+    """Call when a user's role may have changed, so the next check reads it from the database."""
+    g.pop("user_role", None)
+    session.pop("role_cache", None)
+
+
 def auth(action: AuthActions, user_id=None):
-    with current_app.app_context():
-        if action == AuthActions.is_logged_in:
-            return "user_id" in session
+    if action == AuthActions.is_logged_in:
+        return "user_id" in session
 
-        if action == AuthActions.log_in and user_id:
-            session["user_id"] = user_id
-            return
+    if action == AuthActions.log_in and user_id:
+        clear_role_cache()
+        session["user_id"] = user_id
+        return
 
-        if action == AuthActions.log_out:
-            session.clear()
-            return
+    if action == AuthActions.log_out:
+        clear_role_cache()
+        session.clear()
+        return
 
-        if action == AuthActions.get_user_id:
-            return session.get("user_id", None)
+    if action == AuthActions.get_user_id:
+        return session.get("user_id", None)
 
-        if action == AuthActions.is_admin:
-            user_id = session.get("user_id", None)
-            if user_id:
-                user_id = db.session.scalar(select(User.id).where(User.id == user_id).where(User.role == UserRole.admin.value))
-                if user_id:
-                    return True
-            return False
+    if action == AuthActions.is_admin:
+        user_id = session.get("user_id", None)
+        if user_id:
+            return get_user_role(user_id) == UserRole.admin.value
+        return False
 
     raise ValueError(action, user_id)
 
@@ -95,10 +121,8 @@ def admin_required(fn):
 @limiter.limit("30/day", methods=["POST"])
 def login():
     form = LoginForm()
-    captcha = MathCaptcha(tff_file_path=current_app.config["MATH_CAPTCHA_FONT"])
-
     if form.validate_on_submit():
-        if captcha.is_valid(form.captcha_id.data, form.captcha_answer.data):
+        if math_captcha.is_valid(form.captcha_id.data, form.captcha_answer.data):
             username = form.username.data
             password_candidate = form.password.data
 
@@ -113,7 +137,6 @@ def login():
             flash("Incorrect username or password.", "danger")
         flash("Wrong math captcha answer", "danger")
 
-    form.captcha_id.data, form.captcha_b64_img_str = captcha.generate_captcha()
     return render_template("login.html", form=form, CONSTS=CONSTS, is_admin=auth(AuthActions.is_admin))
 
 
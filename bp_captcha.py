@@ -0,0 +1,43 @@
+from flask import Blueprint, abort, jsonify, make_response, request, url_for
+from flask_wtf.csrf import generate_csrf
+
+from captcha import MathCaptcha
+from configs import CONSTS
+
+bp_captcha = Blueprint("bp_captcha", __name__, template_folder="templates")
+
+# Captchas are validated statelessly, so one instance serves every view in the process.
+math_captcha = MathCaptcha(tff_file_path=CONSTS.MATH_CAPTCHA_FONT)
+
+
+@bp_captcha.record_once
+def build_captcha_pool(state):
+    math_captcha.build_pool()
+
+
+@bp_captcha.route("/captcha", methods=["GET"])
+def captcha_new():
+    """
+    Hand out a captcha, fetched by `math_captcha.html` so the pages embedding it stay cacheable.
+    The visitor's csrf token comes along, since statically exported pages carry the exporter's.
+    """
+    captcha_id = math_captcha.generate_captcha_id()
+    response = jsonify(
+        captcha_id=captcha_id,
+        src=url_for("bp_captcha.captcha_image", captcha_id=captcha_id),
+        csrf_token=generate_csrf(),
+    )
+    response.headers.set("Cache-Control", "no-store")
+    return response
+
+
+@bp_captcha.route("/captcha.jpg", methods=["GET"])
+def captcha_image():
+    image = math_captcha.get_image(request.args.get("captcha_id", ""))
+    if not image:
+        abort(404)
+
+    response = make_response(image)
+    response.mimetype = "image/jpeg"
+    response.headers.set("Cache-Control", "public, max-age=86400, immutable")
+    return response
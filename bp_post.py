@@ -1,45 +1,47 @@
-import os
-import subprocess
+import hashlib
+from functools import wraps
 from time import time
 
 from flask import (
     Blueprint,
     current_app,
     flash,
+    make_response,
     redirect,
     render_template,
+    request,
     url_for
 )
 from utils import quote_path
-from sqlalchemy import delete, select, update
-from werkzeug.utils import secure_filename
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import load_only, selectinload, undefer
+from werkzeug.http import is_resource_modified
 from bp_auth import AuthActions, admin_required, auth
-from captcha import MathCaptcha
+from bp_captcha import math_captcha
 from configs import CONSTS
 from forms import CommentForm, PostForm, get_fields, AdminCommentForm
-from models import Comment, File, Post, Tag, db
+from images import image_pipeline
+from models import Comment, File, FileVariant, Post, Tag, db
+from pagination import keyset_paginate
+from renderer import render_post
+from response_cache import response_cache
+from search import index_post, unindex_post
+from spam import spam_filter
+from uploads import delete_upload, upload_files_from_form
 
 bp_post = Blueprint("bp_post", __name__, template_folder="templates")
 
+# the columns `post_list.html` displays
+POST_LIST_COLUMNS = (Post.id, Post.title, Post.path, Post.published_date, Post.last_modified_date, Post.is_published)
 
-def convert_html_to_markdown(html_text):
-    result = subprocess.run(
-        ["/usr/bin/pandoc", "--from=html+raw_html", "--to=markdown"],
-        input=html_text.encode("utf-8"),
-        stdout=subprocess.PIPE,
-    )
-    result.check_returncode()
-    return result.stdout.decode("utf-8")
-
-
-def convert_markdown_to_html(markdown_text):
-    result = subprocess.run(
-        ["/usr/bin/pandoc", "--from=markdown", "--to=html+raw_html"],
-        input=markdown_text.encode("utf-8"),
-        stdout=subprocess.PIPE,
-    )
-    result.check_returncode()
-    return result.stdout.decode("utf-8")
+# Loader options for views that render a post's relationships, so each one costs a single query.
+POST_LIST_OPTIONS = (load_only(*POST_LIST_COLUMNS), selectinload(Post.tags))
+POST_READ_OPTIONS = (
+    undefer(Post.text_html),
+    selectinload(Post.tags),
+    selectinload(Post.files).selectinload(File.variants),
+    selectinload(Post.comments),
+)
 
 
 def get_tags_from_form(form):
@@ -51,41 +53,6 @@ def get_tags_from_form(form):
     return new_tags + existing_tags
 
 
-def delete_upload(file_name):
-    path = os.path.join(current_app.config["UPLOADS_FULL_PATH"], file_name)
-    if os.path.isfile(path):
-        os.remove(path)
-        return
-
-
-def get_filename_datetime():
-    return time().__str__().split(".")[0]
-
-
-def upload_files_from_form(form):
-    files = []
-    for file in form.files.data:
-        file_name = secure_filename(file.filename)
-        if not file_name:
-            continue
-
-        file_type = None
-        for header in file.headers:
-            if header[0] == "Content-Type":
-                file_type = header[1].split("/")[-1]
-                break
-
-        server_file_name = f"{get_filename_datetime()}__{file_name}"
-        relative_path = current_app.config["UPLOADS_REL_PATH"]
-        full_path = os.path.join(current_app.config["UPLOADS_FULL_PATH"], server_file_name)
-        file_data = file.read()
-        with open(full_path, "wb") as f:
-            f.write(file_data)
-
-        files.append(File(file_name=file_name, relative_path=relative_path, server_file_name=server_file_name, file_type=file_type))
-    return files
-
-
 def is_valid_title(db, new_title, is_create=False, exiting_post_id=None) -> bool:
     title_count = db.session.query(Post).filter(Post.title == new_title).count()
 
@@ -115,17 +82,22 @@ def post_create():
 
         post = Post(**d)
 
-        post.text_html = convert_markdown_to_html(post.text_markdown)
+        render_post(post, post.text_markdown)
         post.tags = get_tags_from_form(form)
-        post.files = upload_files_from_form(form)
+        new_files = upload_files_from_form(form)
+        post.files = new_files
         post.user_id = auth(AuthActions.get_user_id)
 
         if is_valid_title(db, post.title, is_create=True):
             post.path = quote_path(d['title'])
 
             db.session.add(post)
+            db.session.flush()
+            index_post(db.session, post)
             flash("Post created.", "success")
             db.session.commit()
+            response_cache.invalidate()
+            image_pipeline.submit(new_files)
 
             form.data.clear()
             return redirect(url_for("bp_post.post_list"))
@@ -138,7 +110,11 @@ def post_create():
 @bp_post.route("/post_edit/<int:post_id>", methods=["GET", "POST"])
 @admin_required
 def post_edit(post_id):
-    post = db.session.scalar(select(Post).where(Post.id == post_id))
+    post = db.session.scalar(
+        select(Post)
+        .options(undefer(Post.text_html), undefer(Post.text_markdown), selectinload(Post.tags), selectinload(Post.files))
+        .where(Post.id == post_id)
+    )
     if not post:
         return redirect(url_for("bp_post.post_list"))
 
@@ -147,7 +123,7 @@ def post_edit(post_id):
     if form.validate_on_submit():
         d = get_fields(Post, PostForm, form)
 
-        post.text_html = convert_markdown_to_html(form.text_markdown.data)
+        render_post(post, form.text_markdown.data)
         post.tags = get_tags_from_form(form)
 
         if is_valid_title(db, d['title'], is_create=False, exiting_post_id=post.id):
@@ -155,12 +131,16 @@ def post_edit(post_id):
             existing_files = []
             if post.files:
                 existing_files = post.files
-            post.files = upload_files_from_form(form) + existing_files
+            new_files = upload_files_from_form(form)
+            post.files = new_files + existing_files
 
             db.session.execute(update(Post).where(Post.id == post.id).values(**d))
+            index_post(db.session, post)
 
             flash("Post updated.", "success")
             db.session.commit()
+            response_cache.invalidate()
+            image_pipeline.submit(new_files)
 
             form.data.clear()
             return redirect(url_for("bp_post.post_list"))
@@ -180,14 +160,14 @@ def post_edit(post_id):
 @bp_post.route("/admin_post_read/<int:post_id>")
 @admin_required
 def admin_post_read(post_id):
-    post = db.session.scalar(select(Post).where(Post.id == post_id))
+    post = db.session.scalar(select(Post).options(*POST_READ_OPTIONS).where(Post.id == post_id))
     return handle_admin_post_read(post)
 
 
 @bp_post.route("/admin_post_read/<string:post_path>", methods=["GET", "POST"])
 @admin_required
 def admin_post_read_path(post_path):
-    post = db.session.scalar(select(Post).where(Post.path == post_path))
+    post = db.session.scalar(select(Post).options(*POST_READ_OPTIONS).where(Post.path == post_path))
     return handle_admin_post_read(post)
 
 
@@ -199,6 +179,7 @@ def handle_admin_post_read(post: Post):
             comment = Comment(post_id=post.id, **d)
             db.session.add(comment)
             db.session.commit()
+            response_cache.invalidate()
             form.data.clear()
             flash("Comment added.", "success")
             return redirect(url_for("bp_post.admin_post_read_path", post_path=post.path))
@@ -219,29 +200,89 @@ def post_read(post_id):
     return handle_post_read(post)
 
 
+def get_post_etag(post_path):
+    """
+    Return the ETag of a published post's page, or None if there is no such post.
+    It comes from one small query, so it can be checked without loading or rendering the post.
+    There is no Last-Modified: last_modified_date is a day that edits don't move, and the page also changes
+    with the cache generation, the site version and the csrf token, so no date validates it.
+    """
+    row = db.session.execute(
+        select(Post.id, Post.last_modified_date, func.max(Comment.published_date))
+        .outerjoin(Comment, Comment.post_id == Post.id)
+        .where(Post.path == post_path)
+        .where(Post.is_published == True)
+        .group_by(Post.id)
+    ).first()
+    if not row:
+        return None
+
+    post_id, last_modified_date, latest_comment_date = row
+
+    # Pages embed a csrf token that expires, so let ETags roll over well before it does.
+    csrf_window = int(time() // ((current_app.config.get("WTF_CSRF_TIME_LIMIT") or 3600) / 2))
+    etag = hashlib.sha1(
+        f"{post_id}:{last_modified_date}:{latest_comment_date}:{response_cache.generation()}:{CONSTS.site_version}:{csrf_window}".encode()
+    ).hexdigest()
+    return etag
+
+
+def conditional_post_read(fn):
+    """Answer anonymous readers whose copy of the post is current with a 304, before any rendering."""
+
+    @wraps(fn)
+    def decorated_function(post_path):
+        etag = None
+        if response_cache.is_cacheable_request():
+            etag = get_post_etag(post_path)
+
+        if not etag:
+            return fn(post_path)
+
+        if not is_resource_modified(request.environ, etag=etag):
+            response = make_response("", 304)
+        else:
+            response = make_response(fn(post_path))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag)
+        response.headers.set("Cache-Control", "no-cache")
+        return response
+
+    return decorated_function
+
+
 @bp_post.route("/post/<string:post_path>", methods=["GET", "POST"])
+@conditional_post_read
+@response_cache.cached
 def post_read_path(post_path):
-    post = db.session.scalar(select(Post).where(Post.path == post_path).where(Post.is_published == True))
+    post = db.session.scalar(select(Post).options(*POST_READ_OPTIONS).where(Post.path == post_path).where(Post.is_published == True))
     return handle_post_read(post)
 
 
 def handle_post_read(post: Post):
     form = CommentForm()
-    captcha = MathCaptcha(tff_file_path=current_app.config["MATH_CAPTCHA_FONT"])
     if post:
         if form.validate_on_submit():
-            if captcha.is_valid(form.captcha_id.data, form.captcha_answer.data):
+            if math_captcha.is_valid(form.captcha_id.data, form.captcha_answer.data):
+                text = f"{form.title.data or ''} {form.text.data}"
+                if not auth(AuthActions.is_admin) and spam_filter.is_spam(text, request.remote_addr):
+                    form.data.clear()
+                    flash("I loath green eggs and spam.", "danger")
+                    return redirect(url_for("bp_post.post_read_path", post_path=post.path))
+
                 d = get_fields(Comment, CommentForm, form)
                 comment = Comment(post_id=post.id, **d)
                 db.session.add(comment)
                 db.session.commit()
+                response_cache.invalidate()
                 form.data.clear()
                 flash("Comment added.", "success")
                 return redirect(url_for("bp_post.post_read_path", post_path=post.path))
 
             flash("Wrong math captcha answer", "danger")
 
-        form.captcha_id.data, form.captcha_b64_img_str = captcha.generate_captcha()
         return render_template("post.html", CONSTS=CONSTS, post=post, form=form, is_admin=auth(AuthActions.is_admin))
 
     flash('Post not found')
@@ -253,11 +294,15 @@ def handle_post_read(post: Post):
 def post_delete(post_id):
     post = db.session.scalar(select(Post).where(Post.id == post_id))
     if post:
-        for file in post.files:
-            delete_upload(file.server_file_name)
+        server_file_names = {file.server_file_name for file in post.files}
 
         db.session.delete(post)
+        unindex_post(db.session, post_id)
         db.session.commit()
+        response_cache.invalidate()
+
+        for server_file_name in server_file_names:
+            delete_upload(server_file_name)
 
         post = db.session.scalar(select(Post).where(Post.id == post_id))
         if not post:
@@ -273,10 +318,14 @@ def post_delete(post_id):
 def post_delete_file(post_id, file_id):
     file = db.session.scalar(select(File).where(File.post_id == post_id).where(File.id == file_id))
     if file:
-        delete_upload(file.server_file_name)
+        server_file_name = file.server_file_name
 
+        db.session.execute(delete(FileVariant).where(FileVariant.file_id == file_id))
         db.session.execute(delete(File).where(File.post_id == post_id).where(File.id == file_id))
         db.session.commit()
+        response_cache.invalidate()
+
+        delete_upload(server_file_name)
 
         file = db.session.scalar(select(File).where(File.id == file_id))
         if not file:
@@ -288,17 +337,23 @@ def post_delete_file(post_id, file_id):
 
 
 @bp_post.route("/posts")
+@response_cache.cached
 def post_list():
-    if auth(AuthActions.is_admin):
-        posts = db.session.scalars(select(Post).order_by(Post.published_date.desc())).all()
-    else:
-        posts = db.session.scalars(select(Post).where(Post.is_published == True).order_by(Post.published_date.desc())).all()
+    stmt = select(Post).options(*POST_LIST_OPTIONS)
+    if not auth(AuthActions.is_admin):
+        stmt = stmt.where(Post.is_published == True)
+
+    cursor = request.args.get("cursor")
+    posts, next_cursor = keyset_paginate(db.session, stmt, Post.published_date, Post.id, cursor, CONSTS.post_list_page_size)
+    next_url = url_for("bp_post.post_list", cursor=next_cursor) if next_cursor else None
 
     header = "Showing all posts."
     return render_template(
         "post_list.html",
         CONSTS=CONSTS,
         posts=posts,
+        cursor=cursor,
+        next_url=next_url,
         header=header,
         is_admin=auth(AuthActions.is_admin),
     )
@@ -0,0 +1,37 @@
+import click
+from flask import Blueprint, render_template, request
+
+from bp_auth import AuthActions, auth
+from configs import CONSTS
+from models import db
+from search import rebuild_search_index, search_posts
+
+bp_search = Blueprint("bp_search", __name__, template_folder="templates", cli_group="search")
+
+
+@bp_search.route("/search", methods=["GET"])
+def search():
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+
+    results, has_next = [], False
+    if query:
+        results, has_next = search_posts(db.session, query, page, CONSTS.search_page_size, include_unpublished=auth(AuthActions.is_admin))
+
+    return render_template(
+        "search.html",
+        CONSTS=CONSTS,
+        query=query,
+        page=page,
+        results=results,
+        has_next=has_next,
+        is_admin=auth(AuthActions.is_admin),
+    )
+
+
+@bp_search.cli.command("rebuild")
+def rebuild():
+    """Rebuild the search index from every post, e.g. `flask --app main search rebuild`."""
+    count = rebuild_search_index(db.session)
+    db.session.commit()
+    click.echo(f"Indexed {count} posts.")
@@ -1,32 +1,37 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, url_for
 from sqlalchemy import select
 
 from bp_auth import AuthActions, auth
+from bp_post import POST_LIST_OPTIONS
 from configs import CONSTS
 from models import BridgeTag, Post, Tag, db
+from pagination import keyset_paginate
+from response_cache import response_cache
 
 bp_tag = Blueprint("bp_tag", __name__, template_folder="templates")
 
 
 @bp_tag.route("/tags/<int:tag_id>")
+@response_cache.cached
 def tag_list(tag_id):
     """Display all posts with Tag.id equal to `tag_id`."""
 
     tag_text = db.session.scalar(select(Tag.text).where(Tag.id == tag_id))
     print(tag_text)
 
-    if auth(AuthActions.is_admin):
-        posts = db.session.scalars(
-            select(Post).join(BridgeTag, Post.id == BridgeTag.post_id).join(Tag, Tag.id == BridgeTag.tag_id).where(Tag.id == tag_id)
-        )
-    else:
-        posts = db.session.scalars(
-            select(Post)
-            .join(BridgeTag, Post.id == BridgeTag.post_id)
-            .join(Tag, Tag.id == BridgeTag.tag_id)
-            .where(Tag.id == tag_id)
-            .where(Post.is_published == True)
-        )
+    stmt = (
+        select(Post)
+        .options(*POST_LIST_OPTIONS)
+        .join(BridgeTag, Post.id == BridgeTag.post_id)
+        .join(Tag, Tag.id == BridgeTag.tag_id)
+        .where(Tag.id == tag_id)
+    )
+    if not auth(AuthActions.is_admin):
+        stmt = stmt.where(Post.is_published == True)
+
+    cursor = request.args.get("cursor")
+    posts, next_cursor = keyset_paginate(db.session, stmt, Post.published_date, Post.id, cursor, CONSTS.post_list_page_size)
+    next_url = url_for("bp_tag.tag_list", tag_id=tag_id, cursor=next_cursor) if next_cursor else None
 
     header = None
     if tag_text:
@@ -36,6 +41,8 @@ def tag_list(tag_id):
         "post_list.html",
         CONSTS=CONSTS,
         posts=posts,
+        cursor=cursor,
+        next_url=next_url,
         header=header,
         is_admin=auth(AuthActions.is_admin),
     )
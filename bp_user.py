@@ -2,7 +2,7 @@ from flask import Blueprint, flash, redirect, render_template, url_for
 from sqlalchemy import select, update
 from werkzeug.security import generate_password_hash
 
-from bp_auth import AuthActions, admin_required, auth
+from bp_auth import AuthActions, admin_required, auth, clear_role_cache
 from configs import CONSTS
 from forms import UserForm, get_fields
 from models import User, db
@@ -43,6 +43,7 @@ def user_edit(user_id):
 
         db.session.execute(update(User).where(User.id == user.id).values(**d))
         db.session.commit()
+        clear_role_cache()
 
         flash("User updated.", "success")
         form.data.clear()
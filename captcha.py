@@ -1,9 +1,18 @@
 import base64
+from functools import lru_cache
 from io import BytesIO
-from random import random
+from random import randint
 
 from PIL import Image, ImageColor, ImageDraw, ImageFont
 
+from request_timing import timed
+
+
+@lru_cache(maxsize=None)
+def load_font(tff_file_path, font_size):
+    """Parse each font file once per process, instead of once per MathCaptcha."""
+    return ImageFont.truetype(tff_file_path, font_size)
+
 
 class MathCaptcha:
     """`tff_file_path` - Path to a .tff file containing the font you want to use."""
@@ -17,12 +26,16 @@ class MathCaptcha:
         background_color=ImageColor.getcolor("black", "RGB"),
     ):
         self.size = size
-        self.font = ImageFont.truetype(tff_file_path, font_size)
+        self.font = load_font(tff_file_path, font_size)
         self.font_color = font_color
         self.background_color = background_color
 
         self.delimiter = "+-*/"
 
+        # captcha_id -> jpeg bytes, for every operand pair, see `build_pool`
+        self.pool = {}
+
+    @timed("captcha")
     def is_valid(self, captcha_id, answer):
         if not captcha_id or not answer:
             return False
@@ -34,7 +47,7 @@ class MathCaptcha:
         except:
             return False
 
-    def generate_image(self, text):
+    def render_image(self, text):
         img = Image.new("RGB", self.size, self.background_color)
         draw = ImageDraw.Draw(img)
         xy = (5, 5)
@@ -42,19 +55,67 @@ class MathCaptcha:
 
         buffered = BytesIO()
         img.save(buffered, format="JPEG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return img_str
+        return buffered.getvalue()
+
+    def generate_image(self, text):
+        return base64.b64encode(self.render_image(text)).decode()
 
     @staticmethod
     def generate_random():
         """Returns a random int between 0 and 10 (inclusive)."""
-        return int(random() * 10)
+        return randint(0, 10)
+
+    def make_captcha_id(self, first_num, second_num):
+        return base64.b64encode(f"{first_num}{self.delimiter}{second_num}".encode()).decode()
+
+    @timed("captcha")
+    def generate_captcha_id(self):
+        return self.make_captcha_id(MathCaptcha.generate_random(), MathCaptcha.generate_random())
 
     def generate_captcha(self):
         first_num = MathCaptcha.generate_random()
         second_num = MathCaptcha.generate_random()
 
-        captcha_id = base64.b64encode(f"{first_num}{self.delimiter}{second_num}".encode()).decode()
+        captcha_id = self.make_captcha_id(first_num, second_num)
         captcha_b64_img_str = self.generate_image(f"{first_num} + {second_num}")
 
         return captcha_id, captcha_b64_img_str
+
+    def build_pool(self):
+        """Render the image of every possible captcha (11 * 11 operand pairs) once, up front."""
+        for first_num in range(11):
+            for second_num in range(11):
+                captcha_id = self.make_captcha_id(first_num, second_num)
+                self.pool[captcha_id] = self.render_image(f"{first_num} + {second_num}")
+
+    @timed("captcha")
+    def get_image(self, captcha_id):
+        """Returns the jpeg bytes for `captcha_id`, or None if it isn't a captcha we generate."""
+        if not self.pool:
+            self.build_pool()
+        return self.pool.get(captcha_id)
+
+
+if __name__ == "__main__":
+    # Micro-benchmark of one request's captcha work, with and without the font cache.
+    import os
+    from timeit import timeit
+
+    font_path = os.path.join(os.path.dirname(__file__), "fonts/tly.ttf")
+    n = 500
+
+    def request_uncached():
+        load_font.cache_clear()
+        MathCaptcha(tff_file_path=font_path).generate_captcha()
+
+    def request_cached():
+        MathCaptcha(tff_file_path=font_path).generate_captcha()
+
+    captcha = MathCaptcha(tff_file_path=font_path)
+    captcha.build_pool()
+
+    def request_pooled():
+        captcha.get_image(captcha.generate_captcha_id())
+
+    for name, fn in [("font loaded per request", request_uncached), ("cached font", request_cached), ("pre-rendered pool", request_pooled)]:
+        print(f"{name:<24} {timeit(fn, number=n) / n * 1e6:>10.1f} us/request")
@@ -10,16 +10,72 @@ from utils import make_path
 class CONSTS(NamedTuple):
     TESTING = True
     PERMANENT_SESSION_LIFETIME = timedelta(days=4)
+    session_role_cache_seconds = 0  # >0 keeps a user's role in their signed session cookie, 0 checks the database each request
     DATABASE_FILE = "DATA.db"
     SQLALCHEMY_DATABASE_URI = "sqlite:////" + make_path(DATABASE_FILE)
     SQLALCHEMY_ECHO = False
+    # Run on each new sqlite connection. WAL lets readers and the writer work concurrently across gunicorn workers.
+    sqlite_pragmas = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",  # safe with WAL, fsyncs at checkpoints rather than on every commit
+        "busy_timeout": 5000,  # ms to wait on a locked database before raising
+        "cache_size": -20000,  # negative values are KiB, so ~20 MB of page cache per connection
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    }
     MAX_CONTENT_LENGTH = 1 * 1024 * 1024 * 1024  # gb
     UPLOADS_REL_PATH = os.path.join("static", "uploads")  # must be somewhere in the app's root directory
     UPLOADS_FULL_PATH = make_path(UPLOADS_REL_PATH)
 
+    post_list_page_size = 50
+    search_page_size = 20
+    index_contacts_page_size = 20  # contact messages shown on the home page
+    admin_page_size = 30
+
     supported_file_uploads = ["jpg", "gif", "png", "jpeg", "mp4", "webm", "mp3"]
+    max_upload_file_size = 512 * 1024 * 1024  # per file, requests are still capped by MAX_CONTENT_LENGTH
+    # How /static/uploads/ is served. "flask" streams uploads from the worker, or, with USE_X_SENDFILE = True,
+    # has Apache/lighttpd send them. "x-accel" has nginx send them from `x_accel_uploads_location`, an
+    # `internal` location aliased to UPLOADS_FULL_PATH.
+    upload_serving = "flask"
+    x_accel_uploads_location = "/internal_uploads/"
+    USE_X_SENDFILE = False
+
+    # jpg/png/gif uploads get resized and WebP copies, made in the background after upload, for `srcset`s
+    image_variant_widths = [320, 640, 1280]
+    image_variant_quality = 80
+    image_variant_workers = 1  # threads per process
 
     store_requests = False
+    # with `store_requests`, log rows are written by a background thread in bulk inserts
+    log_batch_size = 100  # rows per insert
+    log_flush_interval_ms = 1000  # longest a row waits before being written
+    log_queue_size = 10000  # rows buffered per process, extra rows are dropped
+    # `flask --app main logs rollup` folds new rows into hourly and daily aggregates, `logs prune` deletes rolled up
+    # rows older than `log_raw_retention_days`, writing them to gzipped json lines in `log_archive_dir` first, if set.
+    log_rollup_batch_size = 5000  # rows per transaction
+    log_raw_retention_days = 30
+    log_hourly_retention_days = 90  # daily aggregates are kept
+    log_dimension_retention_days = 90  # daily referrer and user agent counts
+    analytics_top_limit = 20  # rows in each of /admin_analytics's top paths, referrers and user agents
+    log_archive_dir = None
+    # Secondary indexes on the log table, each slows every insert. Apply changes with `flask --app main logs indexes`.
+    log_indexes = []  # e.g. ["path", "x_forwarded_for"]
+    # Send each request's sql, template, render and captcha timings in a `Server-Timing` header, shown in the
+    # browser's devtools. They are logged with `store_requests` either way.
+    server_timing_header = True
+
+    # "markdown-it" renders posts in-process, "pandoc" converts them through `pandoc_path` on each save.
+    # Their html differs in a few places, e.g. footnotes are pandoc only, see tests/test_renderer_parity.py
+    markdown_renderer = "markdown-it"
+    pandoc_path = "/usr/bin/pandoc"
+    pandoc_workers = 2  # long-lived pandoc processes per app/migration process
+
+    # Full-page cache of public pages for anonymous visitors.
+    # None, "memory" (an LRU in each process) or "redis" (shared, uses `redis_url`)
+    response_cache_backend = "memory"
+    response_cache_ttl = 300  # seconds
+    response_cache_max_entries = 512  # per process, for the "memory" backend
 
     MATH_CAPTCHA_FONT = os.path.join(os.path.dirname(__file__), "fonts/tly.ttf")
 
@@ -27,6 +83,7 @@ class CONSTS(NamedTuple):
         os.mkdir(UPLOADS_FULL_PATH, mode=770)
 
     datetime_format = "%A, %B %d, %Y"
+    datetime_format_short = "%Y-%m-%d"
     datetime_timezone = "America/Toronto"
 
     with open(make_path("secret.txt"), encoding="utf-8") as f:
@@ -67,6 +124,46 @@ class CONSTS(NamedTuple):
     rss_description = site_name
     rss_link = site_url
     rss_author = site_name
+    rss_item_limit = 50  # newest posts per feed
+
+    # Contact messages and comments scoring `spam_threshold` or more, or sent from `spam_blocked_networks`, are rejected.
+    # Each phrase found adds its weight once, case-insensitively and ignoring apostrophes. Weights must be positive.
+    spam_threshold = 5
+    spam_phrases = {
+        "get it now": 2,
+        "% off": 4,
+        "free": 1,
+        "shipping": 2,
+        "best": 1,
+        "on sale": 2,
+        "gives you": 1,
+        "take care of": 1,
+        "https://": 15,
+        "http://": 15,
+        "www.": 15,
+        "buy": 1,
+        "discount": 2,
+        " price": 3,
+        "get yours here": 4,
+        "get yours": 2,
+        ",\n": 1,
+        "special": 1,
+        "act now": 2,
+        "worlds greatest": 3,
+        "worlds best": 3,
+        "magic sand": 10,
+        " seo ": 3,
+        "any help": 1,
+        "best regards": 3,
+        "outlook.": 15,
+        f"@{site_name}.": 15,
+        "hotmail.": 15,
+        "protonmail.": 15,
+        "yahoo.": 15,
+        "gmail.": 15,
+        "need help with": 15,
+    }
+    spam_blocked_networks = ["91.219.212.0/24", "156.146.51.0/24"]
 
 
 def get_current_datetime(timezone_str=CONSTS.datetime_timezone):
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+from feedgen.feed import FeedGenerator
+from flask import current_app
+from sqlalchemy import select
+
+from configs import CONSTS
+from models import BridgeTag, Post, Tag, db
+from response_cache import response_cache
+from utils import to_utc
+
+FEED_CONTENT_TYPES = {
+    "rss": "text/xml",
+    "atom": "application/atom+xml",
+}
+
+
+class Feed(NamedTuple):
+    generation: int
+    body: bytes
+    content_type: str
+    etag: str
+    last_modified: Optional[datetime]
+
+
+_feeds = {}
+_lock = threading.Lock()
+
+
+def site_url_for(endpoint, **values):
+    """An absolute url on `CONSTS.site_url`, whatever host or prefix the request came with."""
+    return CONSTS.site_url.rstrip("/") + current_app.url_map.bind("localhost").build(endpoint, values)
+
+
+def build_feed(kind, tag_id=None):
+    """
+    Serialize the newest `CONSTS.rss_item_limit` published posts, optionally only those tagged `tag_id`.
+    Returns None if `tag_id` doesn't exist.
+    """
+    generation = response_cache.generation()
+
+    fg = FeedGenerator()
+    fg.id(CONSTS.rss_link)
+    fg.title(CONSTS.rss_title)
+    fg.description(CONSTS.rss_description)
+    fg.link(href=CONSTS.rss_link)
+
+    stmt = select(Post).where(Post.is_published == True)
+
+    if tag_id is not None:
+        tag_text = db.session.scalar(select(Tag.text).where(Tag.id == tag_id))
+        if not tag_text:
+            return None
+        fg.title(f"{CONSTS.rss_title} - {tag_text}")
+        stmt = stmt.join(BridgeTag, Post.id == BridgeTag.post_id).where(BridgeTag.tag_id == tag_id)
+
+    posts = db.session.scalars(stmt.order_by(Post.published_date.desc()).limit(CONSTS.rss_item_limit)).all()
+
+    # feedgen puts entries added later first, so add the oldest first
+    for post in reversed(posts):
+        post_url = site_url_for("bp_post.post_read_path", post_path=post.path)
+        fe = fg.add_entry()
+        fe.title(post.title)
+        fe.link(href=post_url)
+        fe.description(post.title)
+        fe.guid(post_url, permalink=True)
+        fe.author(name=CONSTS.site_name, email=CONSTS.admin_email)
+        fe.pubDate(to_utc(post.published_date, CONSTS.datetime_timezone))
+        fe.updated(to_utc(post.last_modified_date, CONSTS.datetime_timezone))
+
+    updated = max((post.last_modified_date for post in posts), default=None)
+    if updated:
+        fg.updated(to_utc(updated, CONSTS.datetime_timezone))
+
+    # Posts' last_modified_date is a day, and edits don't move it, so Last-Modified is when the cache was last
+    # invalidated, which every post, comment and file write does. Without an invalidation yet, only the ETag is sent.
+    last_modified = datetime.fromtimestamp(generation // 1_000_000_000, timezone.utc) if generation else None
+
+    body = fg.atom_str() if kind == "atom" else fg.rss_str()
+    etag = hashlib.sha1(f"{kind}:{tag_id}:{updated}:{[p.id for p in posts]}:{generation}".encode()).hexdigest()
+    return Feed(generation, body, FEED_CONTENT_TYPES[kind], etag, last_modified)
+
+
+def get_feed(kind, tag_id=None) -> Optional[Feed]:
+    """The serialized feed, rebuilt only after a post, comment or file write invalidated the response cache."""
+    if kind not in FEED_CONTENT_TYPES:
+        raise ValueError(kind)
+
+    key = (kind, tag_id)
+    generation = response_cache.generation()
+    feed = _feeds.get(key)
+    if feed and feed.generation == generation:
+        return feed
+
+    feed = build_feed(kind, tag_id)
+    with _lock:
+        for stale_key in [cached_key for cached_key, cached in _feeds.items() if cached.generation != generation]:
+            del _feeds[stale_key]
+        if feed:
+            _feeds[key] = feed
+    return feed
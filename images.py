@@ -0,0 +1,132 @@
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from PIL import Image, ImageOps
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from configs import CONSTS
+from models import File, FileVariant, db
+from response_cache import response_cache
+from uploads import get_file_extension, get_variant_path
+from utils import PerProcess
+
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "gif"}
+
+PIL_FORMATS = {"jpg": "JPEG", "jpeg": "JPEG", "png": "PNG", "gif": "GIF", "webp": "WEBP"}
+
+
+def save_image(image, path, extension):
+    """Write through a temp file, so a variant being written for another `File` sharing the blob is never half read."""
+    pil_format = PIL_FORMATS[extension]
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    tmp_path = f"{path}.{secrets.token_hex(8)}.part"
+    try:
+        image.save(tmp_path, pil_format, quality=CONSTS.image_variant_quality, optimize=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def make_variants(uploads_dir, server_file_name):
+    """
+    Write the variants of one image and return them as `FileVariant` kwargs: a copy in its own format and
+    a WebP copy for each of `CONSTS.image_variant_widths` narrower than the image, and a full size WebP copy.
+    Variants already on disk, from another `File` sharing the upload, are reused.
+    """
+    extension = get_file_extension(server_file_name)
+    with Image.open(os.path.join(uploads_dir, server_file_name)) as image:
+        # resizing would keep only the first frame
+        if getattr(image, "is_animated", False):
+            return []
+
+        image = ImageOps.exif_transpose(image)
+        widths = [width for width in sorted(CONSTS.image_variant_widths) if width < image.width] + [image.width]
+
+        variants = []
+        for width in widths:
+            height = round(image.height * width / image.width)
+            resized = None
+            for variant_extension in ("webp",) if width == image.width else (extension, "webp"):
+                variant_file_name = get_variant_path(server_file_name, width, variant_extension)
+                variant_path = os.path.join(uploads_dir, variant_file_name)
+                if not os.path.isfile(variant_path):
+                    if resized is None:
+                        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+                    save_image(resized, variant_path, variant_extension)
+
+                variants.append(dict(server_file_name=variant_file_name, file_type=variant_extension, width=width, height=height))
+    return variants
+
+
+def generate_variants(session, uploads_dir, file_ids=None):
+    """Generate the variants of the image files in `file_ids`, or of every image, that don't have any yet."""
+    stmt = select(File).options(selectinload(File.variants))
+    if file_ids is not None:
+        stmt = stmt.where(File.id.in_(file_ids))
+
+    count = 0
+    for file in session.scalars(stmt):
+        if file.variants or get_file_extension(file.server_file_name) not in IMAGE_EXTENSIONS:
+            continue
+
+        try:
+            variants = make_variants(uploads_dir, file.server_file_name)
+        except (OSError, Image.DecompressionBombError) as e:
+            # e.g. a missing file, or one that isn't really an image
+            current_app.logger.warning(f"Unable to make variants of file #{file.id}, {file.server_file_name}: {e!r}")
+            continue
+
+        file.variants = [FileVariant(**variant) for variant in variants]
+        count += 1
+    return count
+
+
+class ImagePipeline:
+    """Generates image variants after the request that uploaded the images, on `CONSTS.image_variant_workers` threads."""
+
+    def __init__(self):
+        self.app = None
+        self.executor = PerProcess(lambda: ThreadPoolExecutor(max_workers=CONSTS.image_variant_workers, thread_name_prefix="images"))
+
+    def init_app(self, app):
+        self.app = app
+
+    def submit(self, files):
+        """Call once `files` are committed."""
+        file_ids = [file.id for file in files if get_file_extension(file.server_file_name) in IMAGE_EXTENSIONS]
+        if file_ids:
+            self.executor.get().submit(self._run, file_ids)
+
+    def _run(self, file_ids):
+        try:
+            with self.app.app_context():
+                if generate_variants(db.session, self.app.config["UPLOADS_FULL_PATH"], file_ids):
+                    db.session.commit()
+                    # cached pages don't have the new srcsets yet
+                    response_cache.invalidate()
+        except Exception:
+            self.app.logger.exception(f"Unable to make variants of files {file_ids}.")
+
+
+image_pipeline = ImagePipeline()
+
+
+images_cli = AppGroup("images", help="Resized and WebP copies of uploaded images.")
+
+
+@images_cli.command("generate")
+def generate_command():
+    """Generate the variants of every uploaded image that doesn't have any, e.g. after migrating."""
+    count = generate_variants(db.session, current_app.config["UPLOADS_FULL_PATH"])
+    db.session.commit()
+    response_cache.invalidate()
+    click.echo(f"Generated variants of {count} images.")
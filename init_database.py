@@ -3,11 +3,14 @@ from sqlalchemy.orm import sessionmaker
 from werkzeug.security import generate_password_hash
 
 from configs import CONSTS
-from models import Comment, Contact, File, Post, Tag, User, UserRole, db
+from models import Comment, Contact, File, Post, Tag, User, UserRole, apply_sqlite_pragmas, db
+from log_rollup import apply_log_indexes
+from search import create_search_index, index_post, search_posts, unindex_post
 
 
 def reset_password_admin(admin_username):
     engine = create_engine(CONSTS.SQLALCHEMY_DATABASE_URI)
+    apply_sqlite_pragmas(engine)
     Session = sessionmaker(bind=engine)
     session = Session()
     password_old = session.scalar(select(User).where(User.username == admin_username)).password
@@ -23,7 +26,11 @@ def build_db():
     """Init and testing, together."""
 
     engine = create_engine(CONSTS.SQLALCHEMY_DATABASE_URI)
+    apply_sqlite_pragmas(engine)
     db.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        create_search_index(connection)
+        apply_log_indexes(connection)
     Session = sessionmaker(bind=engine)
     session = Session()
     session.commit()
@@ -56,6 +63,8 @@ def build_db():
 
     session.add_all([admin1, contact1, post1])
     session.commit()
+    index_post(session, post1)
+    session.commit()
 
     posts = session.scalars(select(Post)).all()
     post = posts[0]
@@ -72,8 +81,12 @@ def build_db():
     contact_name = session.scalar(select(Contact.name))
     assert contact_name == contact1.name
 
+    results, _ = search_posts(session, post1.text_markdown, 1, 10)
+    assert [result["title"] for result in results] == [post1.title]
+
     # delete everything except for admin user
     session.delete(contact1)
+    unindex_post(session, post.id)
     session.delete(post)
     session.delete(tag1)  # cascade deletions do not apply to tags
     session.delete(tag2)
@@ -81,6 +94,7 @@ def build_db():
 
     posts = session.scalars(select(Post)).all()
     assert len(posts) == 0
+    assert search_posts(session, post1.text_markdown, 1, 10) == ([], False)
 
     files = session.scalars(select(File)).all()
     assert len(files) == 0
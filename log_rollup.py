@@ -0,0 +1,366 @@
+import gzip
+import json
+import os
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+from sqlalchemy import delete, func, insert, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from configs import CONSTS
+from models import Log, LogDimensionRollup, LogRollup, LogRollupState
+
+PERIODS = ("hour", "day")
+
+# Upper bounds of the latency histogram buckets. A last, unbounded bucket holds anything slower.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# 404s are rolled up under one path, so scanners probing random urls can't grow the rollups without bound.
+NOT_FOUND_PATH = "(not found)"
+
+# `LogDimensionRollup.dimension`s, rolled up per day
+DIMENSIONS = ("referrer", "user_agent")
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def truncate(dt: datetime, period):
+    dt = dt.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+    return dt.replace(hour=0) if period == "day" else dt
+
+
+def percentile(histogram, q):
+    """
+    Estimate the `q` (0 to 1) latency percentile, in ms, from a `duration_histogram`: the upper bound
+    of the bucket it falls in. None without hits, or if it falls in the unbounded bucket.
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+
+    rank = q * total
+    seen = 0
+    for upper_bound, count in zip(LATENCY_BUCKETS_MS + (None,), histogram):
+        seen += count
+        if seen >= rank:
+            return upper_bound
+    return None
+
+
+def merge_histograms(a, b):
+    return [x + y for x, y in zip(a, b)]
+
+
+class Aggregate:
+    __slots__ = ("hits", "duration_total", "duration_max", "histogram")
+
+    def __init__(self):
+        self.hits = 0
+        self.duration_total = 0.0
+        self.duration_max = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, duration):
+        self.hits += 1
+        if duration is not None:
+            self.duration_total += duration
+            self.duration_max = max(self.duration_max, duration)
+            self.histogram[bisect_left(LATENCY_BUCKETS_MS, duration * 1000)] += 1
+
+
+def _claim_state(session):
+    """
+    Take sqlite's write lock, by writing first, before reading the watermark.
+    Overlapping runs, e.g. from cron, then wait on each other instead of rolling up the same rows twice.
+    """
+    updated = session.execute(update(LogRollupState).where(LogRollupState.id == 1).values(updated_datetime=utc_now()))
+    if not updated.rowcount:
+        session.execute(insert(LogRollupState).values(id=1, last_log_id=0, updated_datetime=utc_now()))
+    return session.scalar(select(LogRollupState.last_log_id).where(LogRollupState.id == 1))
+
+
+def _merge_aggregates(session, aggregates):
+    """Add `aggregates` to their `LogRollup` rows, with one bulk insert and one bulk update by primary key."""
+    # Logs arrive in time order, so a batch only touches a few buckets, found through the unique index.
+    existing = {}
+    for period in PERIODS:
+        buckets = [bucket for key_period, bucket, _, _ in aggregates if key_period == period]
+        if not buckets:
+            continue
+        rows = session.execute(
+            select(
+                LogRollup.id,
+                LogRollup.period,
+                LogRollup.bucket,
+                LogRollup.path,
+                LogRollup.status,
+                LogRollup.hits,
+                LogRollup.duration_total,
+                LogRollup.duration_max,
+                LogRollup.duration_histogram,
+            )
+            .where(LogRollup.period == period)
+            .where(LogRollup.bucket.between(min(buckets), max(buckets)))
+        )
+        for row in rows:
+            existing[(row.period, row.bucket, row.path, row.status)] = row
+
+    inserts = []
+    updates = []
+    for key, aggregate in aggregates.items():
+        row = existing.get(key)
+        if row:
+            updates.append(
+                dict(
+                    id=row.id,
+                    hits=row.hits + aggregate.hits,
+                    duration_total=row.duration_total + aggregate.duration_total,
+                    duration_max=max(row.duration_max, aggregate.duration_max),
+                    duration_histogram=json.dumps(merge_histograms(json.loads(row.duration_histogram), aggregate.histogram)),
+                )
+            )
+        else:
+            period, bucket, path, status = key
+            inserts.append(
+                dict(
+                    period=period,
+                    bucket=bucket,
+                    path=path,
+                    status=status,
+                    hits=aggregate.hits,
+                    duration_total=aggregate.duration_total,
+                    duration_max=aggregate.duration_max,
+                    duration_histogram=json.dumps(aggregate.histogram),
+                )
+            )
+
+    if inserts:
+        session.execute(insert(LogRollup), inserts)
+    if updates:
+        session.execute(update(LogRollup), updates)
+
+
+def _merge_dimension_hits(session, dimension_hits):
+    if not dimension_hits:
+        return
+
+    stmt = sqlite_insert(LogDimensionRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["dimension", "period", "bucket", "value"],
+        set_={"hits": LogDimensionRollup.hits + stmt.excluded.hits},
+    )
+    session.execute(
+        stmt,
+        [
+            dict(dimension=dimension, period=period, bucket=bucket, value=value, hits=hits)
+            for (dimension, period, bucket, value), hits in dimension_hits.items()
+        ],
+    )
+
+
+def get_dimension_values(row):
+    """The referrer's host, so each page of a referring site counts towards the site, and the user agent."""
+    referrer = urlparse(row.referrer).netloc if row.referrer else ""
+    return {
+        "referrer": referrer or "(direct)",
+        "user_agent": (row.user_agent or "")[:255] or "(none)",
+    }
+
+
+def rollup_logs(session, batch_size=None, max_batches=None):
+    """
+    Fold the `Log` rows written since the last run into `LogRollup` and `LogDimensionRollup`,
+    `batch_size` rows per transaction, for up to `max_batches`. Returns the number of rows rolled up.
+    """
+    batch_size = batch_size or CONSTS.log_rollup_batch_size
+    total = 0
+    batches = 0
+    while True:
+        last_log_id = _claim_state(session)
+        rows = session.execute(
+            select(Log.id, Log.path, Log.status, Log.duration, Log.start_datetime_utc, Log.referrer, Log.user_agent)
+            .where(Log.id > last_log_id)
+            .order_by(Log.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            session.commit()
+            return total
+
+        aggregates = {}
+        dimension_hits = {}
+        for row in rows:
+            if row.start_datetime_utc is None:
+                continue
+            path = NOT_FOUND_PATH if row.status == 404 else row.path
+            for period in PERIODS:
+                key = (period, truncate(row.start_datetime_utc, period), path, row.status or 0)
+                aggregate = aggregates.get(key)
+                if not aggregate:
+                    aggregate = aggregates[key] = Aggregate()
+                aggregate.add(row.duration)
+
+            day = truncate(row.start_datetime_utc, "day")
+            for dimension, value in get_dimension_values(row).items():
+                key = (dimension, "day", day, value)
+                dimension_hits[key] = dimension_hits.get(key, 0) + 1
+
+        _merge_aggregates(session, aggregates)
+        _merge_dimension_hits(session, dimension_hits)
+        session.execute(update(LogRollupState).where(LogRollupState.id == 1).values(last_log_id=rows[-1].id))
+        session.commit()
+
+        total += len(rows)
+        batches += 1
+        if len(rows) < batch_size or (max_batches and batches >= max_batches):
+            return total
+
+
+def archive_rows(archive_dir, rows):
+    """Append `rows` as json lines to a gzipped file per day. Appending adds a gzip member, which `zcat` reads as one."""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"log_{utc_now().date().isoformat()}.jsonl.gz")
+    columns = [column.name for column in Log.__table__.columns]
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps({column: getattr(row, column) for column in columns}, default=str) + "\n")
+
+
+def prune_logs(session, raw_retention_days=None, hourly_retention_days=None, batch_size=None, archive_dir=None):
+    """
+    Delete raw `Log` rows older than `raw_retention_days`, once rolled up, in batches of `batch_size`,
+    archiving them to `archive_dir` first if it's set. Also delete hourly rollups older than `hourly_retention_days`,
+    and referrer and user agent rollups past `CONSTS.log_dimension_retention_days`; daily rollups are kept.
+    Returns the number of raw rows deleted.
+    """
+    raw_retention_days = raw_retention_days or CONSTS.log_raw_retention_days
+    hourly_retention_days = hourly_retention_days or CONSTS.log_hourly_retention_days
+    batch_size = batch_size or CONSTS.log_rollup_batch_size
+    archive_dir = archive_dir or CONSTS.log_archive_dir
+
+    last_log_id = session.scalar(select(LogRollupState.last_log_id).where(LogRollupState.id == 1)) or 0
+    cutoff = utc_now() - timedelta(days=raw_retention_days)
+
+    total = 0
+    while True:
+        rows = session.scalars(
+            select(Log).where(Log.id <= last_log_id).where(Log.start_datetime_utc < cutoff).order_by(Log.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        if archive_dir:
+            archive_rows(archive_dir, rows)
+
+        session.execute(delete(Log).where(Log.id.in_([row.id for row in rows])))
+        session.commit()
+        total += len(rows)
+
+    hourly_cutoff = truncate(utc_now() - timedelta(days=hourly_retention_days), "hour")
+    session.execute(delete(LogRollup).where(LogRollup.period == "hour").where(LogRollup.bucket < hourly_cutoff))
+    dimension_cutoff = truncate(utc_now() - timedelta(days=CONSTS.log_dimension_retention_days), "day")
+    session.execute(delete(LogDimensionRollup).where(LogDimensionRollup.bucket < dimension_cutoff))
+    session.commit()
+    return total
+
+
+def apply_log_indexes(connection, columns=None):
+    """Create an `ix_log_<column>` index for each of `columns`, `CONSTS.log_indexes` by default, and drop the others."""
+    columns = CONSTS.log_indexes if columns is None else columns
+    for column in columns:
+        if column not in Log.__table__.columns:
+            raise ValueError(f"log has no column {column!r}")
+
+    wanted = {f"ix_log_{column}": column for column in columns}
+    existing = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'log' AND name LIKE 'ix_log_%'"))
+    for (name,) in existing.all():
+        if name not in wanted:
+            connection.execute(text(f'DROP INDEX "{name}"'))
+
+    for name, column in wanted.items():
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS "{name}" ON log ("{column}")'))
+    return sorted(wanted)
+
+
+def get_latency_summary(histogram, duration_total, hits):
+    return {
+        "hits": hits,
+        "avg_ms": round(duration_total / hits * 1000, 1) if hits else None,
+        "p50_ms": percentile(histogram, 0.5),
+        "p95_ms": percentile(histogram, 0.95),
+        "p99_ms": percentile(histogram, 0.99),
+    }
+
+
+def get_traffic(session, period, since):
+    """Hits and latencies per `period` bucket since `since`, oldest first, over every path."""
+    rows = session.execute(
+        select(LogRollup.bucket, LogRollup.hits, LogRollup.duration_total, LogRollup.duration_histogram)
+        .where(LogRollup.period == period)
+        .where(LogRollup.bucket >= since)
+    ).all()
+
+    buckets = {}
+    for bucket, hits, duration_total, duration_histogram in rows:
+        totals = buckets.setdefault(bucket, [0, 0.0, [0] * (len(LATENCY_BUCKETS_MS) + 1)])
+        totals[0] += hits
+        totals[1] += duration_total
+        totals[2] = merge_histograms(totals[2], json.loads(duration_histogram))
+
+    return [
+        {"bucket": bucket, **get_latency_summary(histogram, duration_total, hits)}
+        for bucket, (hits, duration_total, histogram) in sorted(buckets.items())
+    ]
+
+
+def get_top_paths(session, since, limit):
+    """The `limit` most requested paths since `since`, from the daily rollups, with their latencies."""
+    top = session.execute(
+        select(LogRollup.path, func.sum(LogRollup.hits).label("hits"))
+        .where(LogRollup.period == "day")
+        .where(LogRollup.bucket >= since)
+        .group_by(LogRollup.path)
+        .order_by(func.sum(LogRollup.hits).desc())
+        .limit(limit)
+    ).all()
+
+    rows = session.execute(
+        select(LogRollup.path, LogRollup.duration_total, LogRollup.duration_histogram)
+        .where(LogRollup.period == "day")
+        .where(LogRollup.bucket >= since)
+        .where(LogRollup.path.in_([path for path, _ in top]))
+    ).all()
+
+    latencies = {}
+    for path, duration_total, duration_histogram in rows:
+        totals = latencies.setdefault(path, [0.0, [0] * (len(LATENCY_BUCKETS_MS) + 1)])
+        totals[0] += duration_total
+        totals[1] = merge_histograms(totals[1], json.loads(duration_histogram))
+
+    return [{"path": path, **get_latency_summary(latencies[path][1], latencies[path][0], hits)} for path, hits in top]
+
+
+def get_status_counts(session, since):
+    return session.execute(
+        select(LogRollup.status, func.sum(LogRollup.hits).label("hits"))
+        .where(LogRollup.period == "day")
+        .where(LogRollup.bucket >= since)
+        .group_by(LogRollup.status)
+        .order_by(LogRollup.status)
+    ).all()
+
+
+def get_top_values(session, dimension, since, limit):
+    """The `limit` most common referrers or user agents since `since`."""
+    return session.execute(
+        select(LogDimensionRollup.value, func.sum(LogDimensionRollup.hits).label("hits"))
+        .where(LogDimensionRollup.dimension == dimension)
+        .where(LogDimensionRollup.period == "day")
+        .where(LogDimensionRollup.bucket >= since)
+        .group_by(LogDimensionRollup.value)
+        .order_by(func.sum(LogDimensionRollup.hits).desc())
+        .limit(limit)
+    ).all()
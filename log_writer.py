@@ -0,0 +1,106 @@
+import atexit
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+
+from configs import CONSTS
+from models import Log, db
+from utils import PerProcess
+
+_STOP = object()
+
+
+class LogWriter:
+    """
+    Buffers `Log` rows and writes them from a background thread, in one bulk insert per
+    `log_batch_size` rows or `log_flush_interval_ms`, whichever comes first.
+    Requests never wait on the database for logging. When the queue is full, rows are dropped and counted.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.worker = PerProcess(self._start)
+        self.lock = threading.Lock()
+        self.counters = {"written": 0, "dropped": 0, "failed": 0}
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = CONSTS.log_batch_size
+        self.flush_interval = CONSTS.log_flush_interval_ms / 1000
+        atexit.register(self.stop)
+
+    def _start(self):
+        rows = queue.Queue(maxsize=CONSTS.log_queue_size)
+        thread = threading.Thread(target=self._run, args=(rows,), name="log_writer", daemon=True)
+        thread.start()
+        return rows, thread
+
+    def add(self, row: dict):
+        rows, _ = self.worker.get()
+        try:
+            rows.put_nowait(row)
+        except queue.Full:
+            self._count("dropped")
+
+    def _count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+
+    def _run(self, rows):
+        while True:
+            row = rows.get()
+            if row is _STOP:
+                return
+
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = rows.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stop = True
+                    break
+                batch.append(row)
+
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        try:
+            with self.app.app_context():
+                db.session.execute(insert(Log), batch)
+                db.session.commit()
+            self._count("written", len(batch))
+        except Exception:
+            self.app.logger.exception(f"Unable to write {len(batch)} log rows.")
+            self._count("failed", len(batch))
+
+    def stop(self, timeout=5):
+        """Flush whatever is buffered and stop the thread. Registered to run at exit."""
+        worker = self.worker.peek()
+        if not worker or not worker[1].is_alive():
+            return
+
+        rows, thread = worker
+        try:
+            rows.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def stats(self):
+        worker = self.worker.peek()
+        with self.lock:
+            return {"buffered": worker[0].qsize() if worker else 0, **self.counters}
+
+
+log_writer = LogWriter()
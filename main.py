@@ -1,16 +1,14 @@
 import os
-from datetime import timezone
 
-from feedgen.feed import FeedGenerator
 from flask import (
     Flask,
+    abort,
     flash,
     g,
     make_response,
     redirect,
     render_template,
     request,
-    send_from_directory,
     url_for
 )
 from flask_bootstrap import Bootstrap5
@@ -19,15 +17,25 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 
 from bp_admin import bp_admin
 from bp_auth import AuthActions, auth, bp_auth
+from bp_captcha import bp_captcha, math_captcha
 from bp_post import bp_post
+from bp_search import bp_search
 from bp_tag import bp_tag
 from bp_user import bp_user
-from captcha import MathCaptcha
 from configs import CONSTS, get_current_datetime
+from feeds import get_feed
 from forms import ContactForm, get_fields
+from images import image_pipeline, images_cli
 from init_database import build_db
 from limiter import limiter
-from models import Contact, Log, Post, db
+from log_writer import log_writer
+from models import Contact, Post, apply_sqlite_pragmas, db
+from pagination import keyset_paginate
+from request_timing import request_timer
+from response_cache import response_cache
+from spam import spam_filter
+from static_export import export_site
+from uploads import send_upload
 from utils import make_path
 
 
@@ -37,10 +45,12 @@ def create_app():
     app.config.from_object(CONSTS)
 
     app.register_blueprint(bp_auth)
+    app.register_blueprint(bp_captcha)
     app.register_blueprint(bp_admin)
     app.register_blueprint(bp_user)
     app.register_blueprint(bp_post)
     app.register_blueprint(bp_tag)
+    app.register_blueprint(bp_search)
 
     try:
         # for custom endpoints
@@ -54,9 +64,21 @@ def create_app():
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
 
     db.init_app(app)
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine)
+        request_timer.init_app(app, db.engine)
 
     limiter.init_app(app)
 
+    response_cache.init_app(app)
+
+    log_writer.init_app(app)
+
+    image_pipeline.init_app(app)
+
+    app.cli.add_command(export_site)
+    app.cli.add_command(images_cli)
+
     return app
 
 
@@ -65,7 +87,7 @@ app = create_app()
 
 @app.route("/static/uploads/<path:filename>")
 def uploaded_files(filename):
-    return send_from_directory(app.config["UPLOADS_FULL_PATH"], filename)
+    return send_upload(filename)
 
 
 @app.errorhandler(404)
@@ -104,7 +126,7 @@ def after(response):
         if request.path.startswith("/static/"):
             return response
 
-        log = Log(
+        log_writer.add(dict(
             x_forwarded_for=request.headers.get("X-Forwarded-For", None),
             remote_addr=request.headers.get("Remote-Addr", None),
             referrer=request.referrer,
@@ -113,16 +135,15 @@ def after(response):
             scheme=request.scheme,
             method=request.method,
             path=request.path,
+            status=response.status_code,
             query_string=request.query_string.decode(),
-            duration=(g.end_datetime_utc - g.start_datetime_utc).total_seconds(),
             start_datetime_utc=g.start_datetime_utc,
             end_datetime_utc=g.end_datetime_utc,
             user_agent=request.user_agent.__str__(),
             accept_language=request.headers.get("Accept-Language", None),
             content_length=request.content_length,
-        )
-        db.session.add(log)
-        db.session.commit()
+            **request_timer.get_log_fields(),
+        ))
 
     return response
     
@@ -134,16 +155,13 @@ def favicon():
 
 @app.route("/", methods=["GET", "POST"])
 @limiter.limit("3/day", methods=["POST"])
+@response_cache.cached
 def index():
     form: ContactForm = ContactForm()
-    captcha = MathCaptcha(tff_file_path=app.config["MATH_CAPTCHA_FONT"])
-
-    contacts = db.session.scalars(select(Contact).order_by(Contact.created_datetime.desc())).all()
-    posts = db.session.scalars(select(Post).where(Post.is_published == True).order_by(Post.published_date.desc()).limit(20)).all()
     if form.validate_on_submit():
-        if captcha.is_valid(form.captcha_id.data, form.captcha_answer.data):
+        if math_captcha.is_valid(form.captcha_id.data, form.captcha_answer.data):
 
-            if comment_is_spam(form.message.data) or CONSTS.site_name in form.email.data:
+            if spam_filter.is_spam(form.message.data, request.remote_addr) or CONSTS.site_name in form.email.data:
                 form.data.clear()
                 flash("I loath green eggs and spam.", "danger")
                 return redirect(url_for("index"))
@@ -151,90 +169,66 @@ def index():
             d = get_fields(Contact, ContactForm, form)
             db.session.add(Contact(**d))
             db.session.commit()
+            response_cache.invalidate()
             form.data.clear()
             flash("Message received, thank you!", "success")
             return redirect(url_for("index"))
         flash("Wrong math captcha answer", "danger")
 
-    form.captcha_id.data, form.captcha_b64_img_str = captcha.generate_captcha()
-    return render_template("index.html", CONSTS=CONSTS, posts=posts, form=form, contacts=contacts, is_admin=auth(AuthActions.is_admin))
+    posts = db.session.scalars(select(Post).where(Post.is_published == True).order_by(Post.published_date.desc()).limit(20)).all()
+
+    cursor = request.args.get("cursor")
+    contacts, next_cursor = keyset_paginate(
+        db.session, select(Contact), Contact.created_datetime, Contact.id, cursor, CONSTS.index_contacts_page_size
+    )
+    next_url = url_for("index", cursor=next_cursor, _anchor="latest_comments") if next_cursor else None
+
+    return render_template(
+        "index.html",
+        CONSTS=CONSTS,
+        posts=posts,
+        form=form,
+        contacts=contacts,
+        cursor=cursor,
+        next_url=next_url,
+        is_admin=auth(AuthActions.is_admin),
+    )
 
 
 @app.route("/rss")
 def rss():
-    fg = FeedGenerator()
-    fg.title(CONSTS.rss_title)
-    fg.description(CONSTS.rss_description)
-    fg.link(href=CONSTS.rss_link)
-
-    posts = db.session.scalars(select(Post).where(Post.is_published == True).order_by(Post.published_date.desc())).all()
-    for post in posts:
-        post_url = url_for("bp_post.post_read_path", post_path=post.path, _external=True)
-        fe = fg.add_entry()
-        fe.title(post.title)
-        fe.link(href=post_url)
-        fe.description(post.title)
-        fe.guid(post_url, permalink=True)
-        fe.author(name=CONSTS.site_name, email=CONSTS.admin_email)
-        fe.pubDate(post.published_date.replace(tzinfo=timezone.utc))
-        fe.updated(post.last_modified_date.replace(tzinfo=timezone.utc))
-
-    response = make_response(fg.rss_str())
-    response.headers.set("Content-Type", "text/xml")
+    return feed_response("rss")
 
-    return response
 
+@app.route("/atom")
+def atom():
+    return feed_response("atom")
+
+
+@app.route("/tags/<int:tag_id>/rss")
+def tag_rss(tag_id):
+    return feed_response("rss", tag_id)
+
+
+@app.route("/tags/<int:tag_id>/atom")
+def tag_atom(tag_id):
+    return feed_response("atom", tag_id)
+
+
+def feed_response(kind, tag_id=None):
+    """Serve a cached feed, answering 304 when the reader's ETag or Last-Modified is current."""
+    feed = get_feed(kind, tag_id)
+    if not feed:
+        abort(404)
+
+    response = make_response(feed.body)
+    response.headers.set("Content-Type", feed.content_type)
+    response.headers.set("Cache-Control", "no-cache")
+    response.set_etag(feed.etag)
+    if feed.last_modified:
+        response.last_modified = feed.last_modified
 
-def comment_is_spam(comment):
-    """Checks against blacklisted IP addresses, and vets comment against spam keywords."""
-    blocked_IP_range = ["91.219.212.", "156.146.51."]
-    for blocked_IP in blocked_IP_range:
-        if request.remote_addr.startswith(blocked_IP):
-            return True
-
-    spam_point_threshold = 5
-    spam = {
-        "get it now": 2,
-        "% off": 4,
-        "free": 1,
-        "shipping": 2,
-        "get yours": 1,
-        "best": 1,
-        "on sale": 2,
-        "gives you": 1,
-        "take care of": 1,
-        "https://": 15,
-        "http://": 15,
-        "www.": 15,
-        "buy": 1,
-        "discount": 2,
-        " price": 3,
-        "get yours here": 4,
-        "get yours": 2,
-        ",\n": 1,
-        "special": 1,
-        "act now": 2,
-        "worlds greatest": 3,
-        "worlds best": 3,
-        "magic sand": 10,
-        " seo ": 3,
-        "any help": 1,
-        "best regards": 3,
-        "outlook.": 15,
-        f"@{CONSTS.site_name}.": 15,
-        "hotmail.": 15,
-        "protonmail.": 15,
-        "yahoo.": 15,
-        "gmail.": 15,
-        "need help with": 15,
-    }
-
-    points = 0
-    comment = comment.lower().replace("'", "")
-    for phrase in spam:
-        if phrase in comment:
-            points += spam[phrase]
-    return points >= spam_point_threshold
+    return response.make_conditional(request)
 
 
 if __name__ == "__main__" and app.config["TESTING"]:
@@ -0,0 +1,6 @@
+-- 1. Add columns
+ALTER TABLE post ADD text_markdown_hash TEXT;
+ALTER TABLE post ADD text_html_renderer TEXT;
+
+-- 2. Run mig.py's update_database3 (with test_run=False) to render and stamp every post.
+--    Run it again after changing or upgrading the renderer, it only re-renders stale rows.
@@ -0,0 +1,2 @@
+-- Index for the keyset pagination of the post listings, newest first.
+CREATE INDEX IF NOT EXISTS ix_post_published_date_id ON post (published_date, id);
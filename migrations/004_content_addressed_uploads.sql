@@ -0,0 +1,8 @@
+-- Uploads are stored once per content, in UPLOADS_FULL_PATH/<sha256[:2]>/<sha256[2:4]>/<sha256>.<extension>,
+-- and shared by every file row with that content.
+
+-- 1. Run mig.py's update_database4 (with test_run=False). It
+--    - rebuilds the file table without the UNIQUE constraint on server_file_name, and with a blob_hash column,
+--      since sqlite can't drop a constraint in place,
+--    - moves every existing upload to its content-addressed path, removing duplicates.
+--    Check what it would do with test_run=True first, it prints each move.
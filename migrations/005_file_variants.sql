@@ -0,0 +1,15 @@
+-- Resized and WebP copies of uploaded images, see images.py.
+CREATE TABLE IF NOT EXISTS file_variant (
+	id INTEGER NOT NULL,
+	server_file_name VARCHAR,
+	file_type VARCHAR,
+	width INTEGER,
+	height INTEGER,
+	file_id INTEGER NOT NULL,
+	PRIMARY KEY (id),
+	FOREIGN KEY(file_id) REFERENCES file (id)
+);
+CREATE INDEX IF NOT EXISTS ix_file_variant_id ON file_variant (id);
+CREATE INDEX IF NOT EXISTS ix_file_variant_file_id ON file_variant (file_id);
+
+-- Then generate the variants of existing images with `flask --app main images generate`.
@@ -0,0 +1,2 @@
+-- Index for the keyset pagination of contact messages, on the home page and in admin_contacts, newest first.
+CREATE INDEX IF NOT EXISTS ix_contact_created_datetime_id ON contact (created_datetime, id);
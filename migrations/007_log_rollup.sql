@@ -0,0 +1,30 @@
+-- 1. Add the response status to raw logs, and the rollup tables.
+ALTER TABLE log ADD status INTEGER;
+
+CREATE TABLE IF NOT EXISTS log_rollup (
+	id INTEGER NOT NULL,
+	period VARCHAR NOT NULL,
+	bucket DATETIME NOT NULL,
+	path VARCHAR NOT NULL,
+	status INTEGER NOT NULL,
+	hits INTEGER NOT NULL,
+	duration_total FLOAT NOT NULL,
+	duration_max FLOAT NOT NULL,
+	duration_histogram VARCHAR,
+	PRIMARY KEY (id),
+	UNIQUE (period, bucket, path, status)
+);
+
+CREATE TABLE IF NOT EXISTS log_rollup_state (
+	id INTEGER NOT NULL,
+	last_log_id INTEGER NOT NULL,
+	updated_datetime DATETIME,
+	PRIMARY KEY (id)
+);
+
+-- 2. Drop the log indexes not in CONSTS.log_indexes (by default, all of ix_log_id, ix_log_x_forwarded_for,
+--    ix_log_remote_addr, ix_log_referrer and ix_log_path) with `flask --app main logs indexes`.
+
+-- 3. Roll up the existing rows with `flask --app main logs rollup`, and schedule it and `logs prune`, e.g.
+--    */5 * * * * cd /path/to/blogger && /path/to/venv/bin/flask --app main logs rollup
+--    0 4 * * *   cd /path/to/blogger && /path/to/venv/bin/flask --app main logs prune
@@ -0,0 +1,15 @@
+-- Daily hits per referrer host and user agent, for /admin_analytics.
+CREATE TABLE IF NOT EXISTS log_dimension_rollup (
+	id INTEGER NOT NULL,
+	dimension VARCHAR NOT NULL,
+	period VARCHAR NOT NULL,
+	bucket DATETIME NOT NULL,
+	value VARCHAR NOT NULL,
+	hits INTEGER NOT NULL,
+	PRIMARY KEY (id),
+	UNIQUE (dimension, period, bucket, value)
+);
+
+-- Rows already rolled up by 007 don't count towards these. To include them, empty the rollups and roll up again:
+--   DELETE FROM log_rollup; DELETE FROM log_rollup_state;
+--   flask --app main logs rollup
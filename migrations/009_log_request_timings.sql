@@ -0,0 +1,6 @@
+-- Per request timings, see request_timing.py. Durations are in seconds.
+ALTER TABLE log ADD sql_count INTEGER;
+ALTER TABLE log ADD sql_duration FLOAT;
+ALTER TABLE log ADD template_duration FLOAT;
+ALTER TABLE log ADD render_duration FLOAT;
+ALTER TABLE log ADD captcha_duration FLOAT;
@@ -1,31 +1,16 @@
 import sqlite3
-import subprocess
 
 import os
 import sys
+from socket import gethostname
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
+from configs import CONSTS
+from pandoc_pool import get_pandoc_pool
+from renderer import get_renderer, markdown_hash
+from uploads import get_blob_path, get_file_extension, hash_file
 from utils import quote_path
 
-def convert_html_to_markdown(html_text):
-    result = subprocess.run(
-        ["pandoc", "--from=html+raw_html", "--to=markdown"],
-        input=html_text.encode("utf-8"),
-        stdout=subprocess.PIPE,
-    )
-    result.check_returncode()
-    return result.stdout.decode("utf-8")
-
-
-def convert_markdown_to_html(markdown_text):
-    result = subprocess.run(
-        ["pandoc", "--from=markdown", "--to=html+raw_html"],
-        input=markdown_text.encode("utf-8"),
-        stdout=subprocess.PIPE,
-    )
-    result.check_returncode()
-    return result.stdout.decode("utf-8")
-
 
 def update_database1(db_path, test_run = True):
     conn = sqlite3.connect(db_path)
@@ -42,10 +27,11 @@ def update_database1(db_path, test_run = True):
 
     update_query = "UPDATE post SET text_html = ?, text_markdown = ? WHERE rowid = ? ;"
 
-    for rowid, text in posts:
-        text_markdown = convert_html_to_markdown(text)
-        text_html = convert_markdown_to_html(text_markdown)
+    pool = get_pandoc_pool()
+    texts_markdown = pool.convert_many([text for _, text in posts], "html+raw_html", "markdown")
+    texts_html = pool.convert_many(texts_markdown, "markdown", "html+raw_html")
 
+    for (rowid, _), text_markdown, text_html in zip(posts, texts_markdown, texts_html):
         if not test_run:
             cursor.execute(update_query, (text_html, text_markdown, rowid))
 
@@ -80,7 +66,105 @@ def update_database2(db_path, test_run = True):
     conn.close()
 
 
+def update_database3(db_path, test_run = True):
+    """Re-render posts whose html is missing, or came from other markdown or another renderer version."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT id, text_markdown, text_markdown_hash, text_html_renderer FROM post;")
+    posts = cursor.fetchall()
+
+    renderer = get_renderer()
+    stale = [
+        (pkid, text_markdown)
+        for pkid, text_markdown, text_markdown_hash, text_html_renderer in posts
+        if text_markdown_hash != markdown_hash(text_markdown) or text_html_renderer != renderer.version
+    ]
+    print(f"{len(stale)} of {len(posts)} posts are stale.")
+
+    texts_html = renderer.to_html_many([text_markdown for _, text_markdown in stale])
+
+    update_query = "UPDATE post SET text_html = ?, text_markdown_hash = ?, text_html_renderer = ? WHERE id = ? ;"
+
+    for (pkid, text_markdown), text_html in zip(stale, texts_html):
+        if not test_run:
+            cursor.execute(update_query, (text_html, markdown_hash(text_markdown), renderer.version, pkid))
+
+    if not test_run:
+        conn.commit()
+    conn.close()
+
+
+def update_database4(db_path, test_run = True):
+    """Move uploads to content-addressed storage, see 004_content_addressed_uploads.sql."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute(f"PRAGMA table_info(file)")
+    columns = [col[1] for col in cursor.fetchall()]
+
+    if 'blob_hash' not in columns and not test_run:
+        cursor.executescript(f"""
+            CREATE TEMPORARY TABLE temp AS
+            SELECT id, server, relative_path, server_file_name, file_name, file_type, upload_date, post_id FROM file;
+
+            DROP TABLE file;
+
+            CREATE TABLE file (
+                id INTEGER NOT NULL,
+                server VARCHAR DEFAULT '{gethostname()}',
+                relative_path VARCHAR,
+                server_file_name VARCHAR,
+                blob_hash VARCHAR,
+                file_name VARCHAR,
+                file_type VARCHAR,
+                upload_date DATETIME,
+                post_id INTEGER NOT NULL,
+                PRIMARY KEY (id),
+                FOREIGN KEY(post_id) REFERENCES post (id)
+            );
+            CREATE INDEX ix_file_id ON file (id);
+            CREATE INDEX ix_file_server_file_name ON file (server_file_name);
+
+            INSERT INTO file (id, server, relative_path, server_file_name, file_name, file_type, upload_date, post_id)
+            SELECT id, server, relative_path, server_file_name, file_name, file_type, upload_date, post_id FROM temp;
+
+            DROP TABLE temp;
+        """)
+        columns.append('blob_hash')
+
+    cursor.execute("SELECT id, server_file_name FROM file" + (" WHERE blob_hash IS NULL;" if 'blob_hash' in columns else ";"))
+
+    files = cursor.fetchall()
+
+    update_query = "UPDATE file SET server_file_name = ?, blob_hash = ? WHERE id = ? ;"
+
+    for pkid, server_file_name in files:
+        path = os.path.join(CONSTS.UPLOADS_FULL_PATH, server_file_name)
+        if not os.path.isfile(path):
+            print(f"Missing file #{pkid}, {path}")
+            continue
+
+        blob_hash = hash_file(path)
+        blob_path = get_blob_path(blob_hash, get_file_extension(server_file_name))
+        full_blob_path = os.path.join(CONSTS.UPLOADS_FULL_PATH, blob_path)
+        print(f"{server_file_name} -> {blob_path}{' (duplicate)' if os.path.isfile(full_blob_path) else ''}")
+
+        if not test_run:
+            if os.path.isfile(full_blob_path):
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(full_blob_path), exist_ok=True)
+                os.replace(path, full_blob_path)
+            cursor.execute(update_query, (blob_path, blob_hash, pkid))
+            conn.commit()
+
+    conn.close()
+
+
 if __name__ == "__main__":
     db_path = "blogger.db"
     update_database1(db_path, test_run=False)
     update_database2(db_path, test_run=False)
+    update_database3(db_path, test_run=False)
+    update_database4(db_path, test_run=False)
@@ -8,14 +8,16 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Table,
-    UniqueConstraint
+    UniqueConstraint,
+    event
 )
-from sqlalchemy.orm import DeclarativeBase, registry, relationship
+from sqlalchemy.orm import DeclarativeBase, deferred, registry, relationship
 
-from configs import get_current_datetime
+from configs import CONSTS, get_current_datetime
 
 mapper_registry = registry()
 
@@ -32,6 +34,19 @@ class Base(DeclarativeBase):
 db = SQLAlchemy(model_class=Base)
 
 
+def apply_sqlite_pragmas(engine):
+    """Run `CONSTS.sqlite_pragmas` on every connection `engine` opens."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in CONSTS.sqlite_pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
+
+
 class User(db.Model):
     __tablename__ = "user"
 
@@ -60,20 +75,31 @@ class Contact(db.Model):
     message = Column(String, nullable=False)
     created_datetime = Column(DateTime(timezone=True), nullable=False, default=get_current_datetime)
 
+    # for the keyset pagination of contacts, newest first
+    __table_args__ = (Index("ix_contact_created_datetime_id", "created_datetime", "id"),)
+
 
 class Log(db.Model):
+    """Raw request logs. Secondary indexes are `CONSTS.log_indexes`, kept in sync by `log_rollup.apply_log_indexes`."""
+
     __tablename__ = "log"
-    id = Column(Integer, primary_key=True, index=True)
-    x_forwarded_for = Column(String, index=True)
-    remote_addr = Column(String, index=True)
-    referrer = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    x_forwarded_for = Column(String)
+    remote_addr = Column(String)
+    referrer = Column(String)
     content_md5 = Column(String)
     origin = Column(String)
     scheme = Column(String)
     method = Column(String)
-    path = Column(String, index=True)
+    path = Column(String)
+    status = Column(Integer)
     query_string = Column(String)
-    duration = Column(Float)
+    duration = Column(Float)  # seconds, like the other durations, on a monotonic clock
+    sql_count = Column(Integer)
+    sql_duration = Column(Float)
+    template_duration = Column(Float)
+    render_duration = Column(Float)  # markdown-it or pandoc
+    captcha_duration = Column(Float)
     start_datetime_utc = Column(DateTime(timezone=True))
     end_datetime_utc = Column(DateTime(timezone=True))
     user_agent = Column(String)
@@ -83,6 +109,46 @@ class Log(db.Model):
     content_length = Column(Integer)
 
 
+class LogRollup(db.Model):
+    """`Log` rows aggregated per hour and per day, path and status, by `log_rollup.rollup_logs`."""
+
+    __tablename__ = "log_rollup"
+    id = Column(Integer, primary_key=True)
+    period = Column(String, nullable=False)  # "hour" or "day"
+    bucket = Column(DateTime, nullable=False)  # start of the hour or day, UTC
+    path = Column(String, nullable=False)
+    status = Column(Integer, nullable=False, default=0)  # 0 for rows logged before statuses were
+    hits = Column(Integer, nullable=False, default=0)
+    duration_total = Column(Float, nullable=False, default=0)  # seconds
+    duration_max = Column(Float, nullable=False, default=0)
+    duration_histogram = Column(String)  # json list of hit counts per `log_rollup.LATENCY_BUCKETS_MS`
+
+    __table_args__ = (UniqueConstraint("period", "bucket", "path", "status"),)
+
+
+class LogDimensionRollup(db.Model):
+    """Daily hits per referrer host and per user agent, by `log_rollup.rollup_logs`."""
+
+    __tablename__ = "log_dimension_rollup"
+    id = Column(Integer, primary_key=True)
+    dimension = Column(String, nullable=False)  # "referrer" or "user_agent"
+    period = Column(String, nullable=False)
+    bucket = Column(DateTime, nullable=False)
+    value = Column(String, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (UniqueConstraint("dimension", "period", "bucket", "value"),)
+
+
+class LogRollupState(db.Model):
+    """A single row, with the id of the last `Log` row rolled up."""
+
+    __tablename__ = "log_rollup_state"
+    id = Column(Integer, primary_key=True)
+    last_log_id = Column(Integer, nullable=False, default=0)
+    updated_datetime = Column(DateTime)
+
+
 bridge_tag = Table(
     "bridge_tag",
     db.metadata,
@@ -105,7 +171,9 @@ class File(db.Model):
     id = Column(Integer, primary_key=True, index=True)
     server = Column(String, server_default=gethostname())
     relative_path = Column(String)
-    server_file_name = Column(String, unique=True)
+    # uploads are stored once per content, so several rows can share a `server_file_name`
+    server_file_name = Column(String, index=True)
+    blob_hash = Column(String)  # sha256 of the content, None for files stored before content addressing
     file_name = Column(String)
     file_type = Column(String)
     upload_date = Column(DateTime(), default=get_current_datetime)
@@ -113,10 +181,27 @@ class File(db.Model):
     post_id = Column(Integer, ForeignKey("post.id"), nullable=False)
     post = relationship("Post", back_populates="files")
 
+    variants = relationship("FileVariant", back_populates="file", cascade="all, delete", order_by="FileVariant.width")
+
     def __unicode__(self):
         return self.file_name
 
 
+class FileVariant(db.Model):
+    """A resized or re-encoded copy of an image `File`, generated in the background by `images.py`."""
+
+    __tablename__ = "file_variant"
+
+    id = Column(Integer, primary_key=True, index=True)
+    server_file_name = Column(String)
+    file_type = Column(String)
+    width = Column(Integer)
+    height = Column(Integer)
+
+    file_id = Column(Integer, ForeignKey("file.id"), nullable=False, index=True)
+    file = relationship("File", back_populates="variants")
+
+
 class Tag(db.Model):
     __tablename__ = "tag"
 
@@ -138,12 +223,16 @@ class Post(db.Model):
     """
 
     __tablename__ = "post"
+    __table_args__ = (Index("ix_post_published_date_id", "published_date", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
     path = Column(String)
-    text_html = Column(String)
-    text_markdown = Column(String)
+    # the bodies are only loaded when accessed, or when a query asks for them with `undefer`
+    text_html = deferred(Column(String))
+    text_markdown = deferred(Column(String))
+    text_markdown_hash = Column(String)  # sha256 of the markdown that `text_html` was rendered from
+    text_html_renderer = Column(String)  # version of the renderer that produced `text_html`
     published_date = Column(DateTime(), default=get_current_datetime)
     last_modified_date = Column(DateTime(), default=get_current_datetime)
     is_published = Column(Boolean, default=True)
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(sort_value: datetime, pkid: int) -> str:
+    return f"{sort_value.isoformat()}_{pkid}"
+
+
+def decode_cursor(cursor):
+    """Returns (datetime, id), or None for a missing or malformed cursor."""
+    try:
+        sort_value, pkid = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(sort_value), int(pkid)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_paginate(session, stmt, sort_col, id_col, cursor, page_size):
+    """
+    Return one page of `stmt`, newest first, and the cursor of the next page (None on the last page).
+    Pages are found with a `(sort_col, id_col) < cursor` condition rather than an OFFSET, so every
+    page costs the same no matter how deep it is. Keep an index on `(sort_col, id_col)`.
+    """
+    stmt = stmt.order_by(sort_col.desc(), id_col.desc())
+
+    decoded = decode_cursor(cursor)
+    if decoded:
+        sort_value, pkid = decoded
+        stmt = stmt.where(or_(sort_col < sort_value, and_(sort_col == sort_value, id_col < pkid)))
+
+    items = session.scalars(stmt.limit(page_size + 1)).all()
+
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_col.key), getattr(last, id_col.key))
+
+    return items, next_cursor
@@ -0,0 +1,155 @@
+import atexit
+import queue
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from configs import CONSTS
+from utils import PerProcess, make_path
+
+WORKER_SCRIPT = make_path("pandoc_worker.lua")
+
+
+class PandocError(Exception):
+    pass
+
+
+class PandocWorkerError(PandocError):
+    """The worker process died or could not be started."""
+
+
+def run_pandoc(text, from_format, to_format, pandoc_path=CONSTS.pandoc_path):
+    """Convert a single document with a fresh pandoc process."""
+    result = subprocess.run(
+        [pandoc_path, f"--from={from_format}", f"--to={to_format}"],
+        input=(text or "").encode("utf-8"),
+        stdout=subprocess.PIPE,
+    )
+    result.check_returncode()
+    return result.stdout.decode("utf-8")
+
+
+class PandocWorker:
+    """A `pandoc lua` process that converts documents sent over its stdin, see `pandoc_worker.lua`."""
+
+    def __init__(self, pandoc_path):
+        self.process = subprocess.Popen(
+            [pandoc_path, "lua", WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def convert(self, text, from_format, to_format):
+        data = (text or "").encode("utf-8")
+        try:
+            self.process.stdin.write(f"{from_format}\t{to_format}\t{len(data)}\n".encode() + data)
+            self.process.stdin.flush()
+            header = self.process.stdout.readline()
+            status, size = header.split(b"\t")
+            result = self.process.stdout.read(int(size)).decode("utf-8")
+        except (OSError, ValueError) as e:
+            raise PandocWorkerError(from_format, to_format) from e
+
+        if status != b"ok":
+            raise PandocError(result)
+
+        # match the pandoc cli, which ends its output with a newline
+        if not result.endswith("\n"):
+            result += "\n"
+        return result
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+
+class PandocPool:
+    """
+    A small set of long-lived pandoc workers, so conversions don't pay pandoc's start-up cost per document.
+    Workers are started on demand, up to `size`. If this pandoc has no `lua` subcommand (pandoc < 3.0),
+    the pool falls back to one pandoc process per document.
+    """
+
+    def __init__(self, pandoc_path=CONSTS.pandoc_path, size=CONSTS.pandoc_workers):
+        self.pandoc_path = pandoc_path
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.started = 0
+        self.lock = threading.Lock()
+        self.persistent = None  # unknown until the first worker answers
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            if self.started < self.size:
+                worker = PandocWorker(self.pandoc_path)
+                self.started += 1
+                return worker
+
+        return self.idle.get()
+
+    def _release(self, worker):
+        if worker.is_alive():
+            self.idle.put(worker)
+            return
+
+        worker.close()
+        with self.lock:
+            self.started -= 1
+
+    def convert(self, text, from_format, to_format):
+        if self.persistent is False:
+            return run_pandoc(text, from_format, to_format, self.pandoc_path)
+
+        worker = self._acquire()
+        try:
+            result = worker.convert(text, from_format, to_format)
+        except PandocWorkerError:
+            worker.close()
+            if not self.persistent:
+                self.persistent = False
+            return run_pandoc(text, from_format, to_format, self.pandoc_path)
+        finally:
+            self._release(worker)
+
+        self.persistent = True
+        return result
+
+    def convert_many(self, texts, from_format, to_format):
+        """Convert a batch of documents across all workers, keeping their order."""
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(executor.map(lambda text: self.convert(text, from_format, to_format), texts))
+
+    def close(self):
+        with self.lock:
+            while True:
+                try:
+                    self.idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self.started = 0
+
+
+def _make_pool():
+    pool = PandocPool()
+    atexit.register(pool.close)
+    return pool
+
+
+_pool = PerProcess(_make_pool)
+
+
+def get_pandoc_pool() -> PandocPool:
+    """Return this process's pool."""
+    return _pool.get()
@@ -0,0 +1,30 @@
+-- Long-lived pandoc worker, started by pandoc_pool.py as `pandoc lua pandoc_worker.lua`.
+-- Request:  "<from>\t<to>\t<byte count>\n" followed by the document.
+-- Response: "ok|err\t<byte count>\n" followed by the converted document or the error message.
+
+io.stdout:setvbuf("full")
+
+while true do
+  local header = io.read("l")
+  if not header then
+    break
+  end
+
+  local from, to, size = header:match("^(%S+)\t(%S+)\t(%d+)$")
+  size = tonumber(size) or 0
+
+  local text = ""
+  if size > 0 then
+    text = io.read(size) or ""
+  end
+
+  local ok, result = pcall(function()
+    return pandoc.write(pandoc.read(text, from), to)
+  end)
+  if not ok then
+    result = tostring(result)
+  end
+
+  io.write(ok and "ok" or "err", "\t", #result, "\n", result)
+  io.stdout:flush()
+end
@@ -0,0 +1,193 @@
+import hashlib
+import re
+import subprocess
+from functools import cached_property
+
+import markdown_it
+from markdown_it import MarkdownIt
+from markdown_it.token import Token
+from markdown_it.common.utils import escapeHtml, unescapeAll
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
+
+from configs import CONSTS
+from pandoc_pool import get_pandoc_pool
+from request_timing import timed
+
+
+class MarkdownRenderer:
+    """Base class for the backends that turn a post's markdown into the HTML stored in `Post.text_html`."""
+
+    name = None
+
+    @property
+    def version(self):
+        """Identifies the html this renderer produces. Posts rendered by another version are stale."""
+        raise NotImplementedError
+
+    def to_html(self, markdown_text):
+        raise NotImplementedError
+
+    def to_html_many(self, markdown_texts):
+        return [self.to_html(markdown_text) for markdown_text in markdown_texts]
+
+
+def pandoc_identifier(text):
+    """Mimic pandoc's `auto_identifiers` extension so heading anchors match posts rendered by pandoc."""
+    text = "".join(c for c in text if c.isalnum() or c in "_-. \n\t")
+    text = re.sub(r"\s+", "-", text.strip()).lower()
+    for i, c in enumerate(text):
+        if c.isalpha():
+            return text[i:]
+    return "section"
+
+
+def heading_ids(state):
+    seen = {}
+    tokens = state.tokens
+    for i, token in enumerate(tokens):
+        if token.type != "heading_open" or token.attrGet("id"):
+            continue
+
+        inline = tokens[i + 1]
+        text = "".join(child.content for child in inline.children or [] if child.type in ("text", "code_inline"))
+        identifier = pandoc_identifier(text)
+
+        if identifier in seen:
+            seen[identifier] += 1
+            identifier = f"{identifier}-{seen[identifier]}"
+        else:
+            seen[identifier] = 0
+
+        token.attrSet("id", identifier)
+
+
+def smart_dashes(state):
+    """Pandoc's `smart` dashes and ellipses. markdown-it's own `replacements` rule also turns e.g. (c) into ©, pandoc doesn't."""
+    children = [child for token in state.tokens if token.type == "inline" for child in token.children or []]
+    while children:
+        child = children.pop()
+        # e.g. an image's alt text
+        children.extend(child.children or [])
+        if child.type == "text":
+            child.content = child.content.replace("---", "\u2014").replace("--", "\u2013").replace("...", "\u2026")
+
+
+def implicit_figures(state):
+    """Like pandoc's `implicit_figures`: an image with alt text alone in a paragraph becomes a figure, captioned by its alt text."""
+    tokens = state.tokens
+    for i, token in enumerate(tokens):
+        if token.type != "paragraph_open" or token.hidden:
+            continue
+
+        inline = tokens[i + 1]
+        if len(inline.children or []) != 1 or inline.children[0].type != "image" or not inline.children[0].children:
+            continue
+
+        image = inline.children[0]
+        caption_open, caption_close = Token("html_inline", "", 0), Token("html_inline", "", 0)
+        caption_open.content, caption_close.content = '<figcaption aria-hidden="true">', "</figcaption>"
+        inline.children = [image, caption_open, *image.children, caption_close]
+        token.tag = tokens[i + 2].tag = "figure"
+
+
+def render_fence(self, tokens, idx, options, env):
+    """Highlight fenced code with pygments, in the `sourceCode` markup pandoc uses. Unknown languages are left plain, as pandoc does."""
+    token = tokens[idx]
+    language = unescapeAll(token.info).split(maxsplit=1)[0] if token.info.strip() else ""
+    if not language:
+        return f"<pre><code>{escapeHtml(token.content)}</code></pre>\n"
+
+    try:
+        lexer = get_lexer_by_name(language)
+    except ClassNotFound:
+        return f'<pre class="{escapeHtml(language)}"><code>{escapeHtml(token.content)}</code></pre>\n'
+
+    code = highlight(token.content, lexer, HtmlFormatter(nowrap=True))
+    language = escapeHtml(language)
+    return f'<div class="sourceCode"><pre class="sourceCode {language}"><code class="sourceCode {language}">{code}</code></pre></div>\n'
+
+
+class MarkdownItRenderer(MarkdownRenderer):
+    """
+    In-process renderer. Configured to stay close to pandoc's output: raw html, tables, strikethrough, heading ids,
+    smart punctuation, figures and highlighted code. The differences that remain are listed in tests/test_renderer_parity.py.
+    """
+
+    name = "markdown-it"
+
+    # bump when the parser configuration or the rules below change the output
+    revision = 2
+
+    @property
+    def version(self):
+        return f"{self.name}-{markdown_it.__version__}-{self.revision}"
+
+    def __init__(self):
+        self.md = MarkdownIt("commonmark", {"html": True, "typographer": True}).enable(["table", "strikethrough", "smartquotes"])
+        self.md.core.ruler.push("heading_ids", heading_ids)
+        self.md.core.ruler.push("smart_dashes", smart_dashes)
+        self.md.core.ruler.push("implicit_figures", implicit_figures)
+        self.md.add_render_rule("s_open", lambda *args: "<del>")
+        self.md.add_render_rule("s_close", lambda *args: "</del>")
+        self.md.add_render_rule("fence", render_fence)
+
+    def to_html(self, markdown_text):
+        return self.md.render(markdown_text or "")
+
+
+class PandocRenderer(MarkdownRenderer):
+    """Converts through the process's pool of long-lived pandoc workers."""
+
+    name = "pandoc"
+
+    @cached_property
+    def version(self):
+        result = subprocess.run([CONSTS.pandoc_path, "--version"], stdout=subprocess.PIPE)
+        result.check_returncode()
+        return result.stdout.decode("utf-8").splitlines()[0].replace(" ", "-")
+
+    def to_html(self, markdown_text):
+        return get_pandoc_pool().convert(markdown_text, "markdown", "html+raw_html")
+
+    def to_html_many(self, markdown_texts):
+        return get_pandoc_pool().convert_many(markdown_texts, "markdown", "html+raw_html")
+
+
+RENDERERS = {renderer.name: renderer for renderer in [MarkdownItRenderer, PandocRenderer]}
+
+_renderers = {}
+
+
+def get_renderer(name=CONSTS.markdown_renderer) -> MarkdownRenderer:
+    """Return the shared renderer instance for `name`, one of the keys in `RENDERERS`."""
+    if name not in RENDERERS:
+        raise ValueError(name)
+
+    if name not in _renderers:
+        _renderers[name] = RENDERERS[name]()
+    return _renderers[name]
+
+
+def markdown_hash(markdown_text):
+    return hashlib.sha256((markdown_text or "").encode("utf-8")).hexdigest()
+
+
+@timed("render")
+def render_post(post, markdown_text) -> bool:
+    """
+    Render `markdown_text` into `post.text_html`, unless the post already holds the html for exactly
+    this markdown from the current renderer version. Returns True if the markdown was converted.
+    """
+    renderer = get_renderer()
+    text_markdown_hash = markdown_hash(markdown_text)
+
+    if post.text_html is not None and post.text_markdown_hash == text_markdown_hash and post.text_html_renderer == renderer.version:
+        return False
+
+    post.text_html = renderer.to_html(markdown_text)
+    post.text_markdown_hash = text_markdown_hash
+    post.text_html_renderer = renderer.version
+    return True
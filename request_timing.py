@@ -0,0 +1,117 @@
+import time
+from contextlib import ContextDecorator
+
+from flask import before_render_template, g, has_app_context, template_rendered
+from sqlalchemy import event
+
+from configs import CONSTS
+
+# `timed` names, in `Server-Timing` order after "sql" and "template"
+TIMED_NAMES = ("render", "captcha")
+
+
+def get_timings():
+    """The current request's timings, or None outside of one, e.g. on the log writer's or image pipeline's threads."""
+    if has_app_context():
+        return g.get("timings")
+    return None
+
+
+class timed(ContextDecorator):
+    """Add the time spent in a block, or a decorated function, to the request's `name` timing, in seconds."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def _recreate_cm(self):
+        # a fresh instance per decorated call, so concurrent and nested calls don't share `start`
+        return timed(self.name)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        timings = get_timings()
+        if timings is not None:
+            timings[self.name] += time.perf_counter() - self.start
+        return False
+
+
+class RequestTimer:
+    """
+    Times each request on a monotonic clock: its SQL statements, counted and timed through engine events,
+    its templates, through Flask's template signals, and the `timed` blocks, e.g. markdown/pandoc and captchas.
+    The timings are sent in a `Server-Timing` header, and `main.after` stores them on `Log`.
+    """
+
+    def init_app(self, app, engine):
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+        before_render_template.connect(self._before_render_template, app)
+        template_rendered.connect(self._template_rendered, app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    @staticmethod
+    def _before_request():
+        g.timings = dict(start=time.perf_counter(), sql_count=0, sql=0.0, template=0.0, **{name: 0.0 for name in TIMED_NAMES})
+        g.timing_starts = []
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("timing_starts", []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["timing_starts"].pop()
+        timings = get_timings()
+        if timings is not None:
+            timings["sql_count"] += 1
+            timings["sql"] += time.perf_counter() - start
+
+    @staticmethod
+    def _handle_error(exception_context):
+        # a failed statement never reaches `after_cursor_execute`
+        if exception_context.connection is not None and exception_context.connection.info.get("timing_starts"):
+            exception_context.connection.info["timing_starts"].pop()
+
+    @staticmethod
+    def _before_render_template(sender, template, context, **extra):
+        if get_timings() is not None:
+            g.timing_starts.append(time.perf_counter())
+
+    @staticmethod
+    def _template_rendered(sender, template, context, **extra):
+        timings = get_timings()
+        if timings is not None and g.timing_starts:
+            timings["template"] += time.perf_counter() - g.timing_starts.pop()
+
+    @staticmethod
+    def get_log_fields():
+        """The `Log` columns for the current request so far, in seconds."""
+        timings = get_timings()
+        if timings is None:
+            return {}
+        return dict(
+            duration=time.perf_counter() - timings["start"],
+            sql_count=timings["sql_count"],
+            sql_duration=timings["sql"],
+            template_duration=timings["template"],
+            render_duration=timings["render"],
+            captcha_duration=timings["captcha"],
+        )
+
+    @staticmethod
+    def _after_request(response):
+        timings = get_timings()
+        if CONSTS.server_timing_header and timings is not None:
+            metrics = [f'sql;dur={timings["sql"] * 1000:.1f};desc="{timings["sql_count"]} statements"']
+            metrics += [f"{name};dur={timings[name] * 1000:.1f}" for name in ("template",) + TIMED_NAMES if timings[name]]
+            metrics.append(f"total;dur={(time.perf_counter() - timings['start']) * 1000:.1f}")
+            response.headers.set("Server-Timing", ", ".join(metrics))
+        return response
+
+
+request_timer = RequestTimer()
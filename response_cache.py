@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import redis
+from flask import current_app, g, make_response, request, session
+from flask_wtf.csrf import generate_csrf
+
+from configs import CONSTS
+from utils import make_path
+
+# Rendered pages are stored with this in place of the visitor's csrf token, and get the
+# current visitor's token back when served, so forms on cached pages keep working.
+CSRF_PLACEHOLDER = b"__response_cache_csrf_token__"
+
+# Touched on every invalidation. Its mtime tells each process whether what it cached is still current.
+STAMP_FILE = make_path("response_cache.stamp")
+
+
+def read_stamp():
+    try:
+        return os.stat(STAMP_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def touch_stamp():
+    with open(STAMP_FILE, "a", encoding="utf-8"):
+        pass
+    os.utime(STAMP_FILE)
+
+
+class MemoryBackend:
+    """
+    A per-process LRU with a TTL. Every process drops its entries once it sees `STAMP_FILE`
+    change, so one gunicorn worker can invalidate the others.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.stamp = read_stamp()
+
+    def get(self, key):
+        stamp = read_stamp()
+        with self.lock:
+            if stamp != self.stamp:
+                self.entries.clear()
+                self.stamp = stamp
+                return None
+
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.stamp = read_stamp()
+
+    def incr(self, counter):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + 1
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), **self.counters}
+
+
+class RedisBackend:
+    """Shared by every process. `clear()` bumps a generation number that is part of every key."""
+
+    prefix = "response_cache"
+
+    def __init__(self, redis_url, ttl):
+        self.redis = redis.Redis.from_url(redis_url, socket_connect_timeout=1)
+        self.ttl = ttl
+
+    def _key(self, key):
+        generation = int(self.redis.get(f"{self.prefix}:generation") or 0)
+        return f"{self.prefix}:{generation}:{key}"
+
+    def get(self, key):
+        return self.redis.get(self._key(key))
+
+    def set(self, key, value):
+        self.redis.set(self._key(key), value, ex=self.ttl)
+
+    def clear(self):
+        self.redis.incr(f"{self.prefix}:generation")
+
+    def incr(self, counter):
+        self.redis.incr(f"{self.prefix}:counter:{counter}")
+
+    def stats(self):
+        counters = ["hits", "misses", "stores", "invalidations"]
+        values = self.redis.mget([f"{self.prefix}:counter:{counter}" for counter in counters])
+        return {counter: int(value or 0) for counter, value in zip(counters, values)}
+
+
+class ResponseCache:
+    """
+    Caches the html of public pages for anonymous visitors.
+    Views opt in with `@response_cache.cached`, and writes call `response_cache.invalidate()`.
+    """
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        backend = CONSTS.response_cache_backend
+        if backend == "memory":
+            self.backend = MemoryBackend(CONSTS.response_cache_max_entries, CONSTS.response_cache_ttl)
+        elif backend == "redis":
+            self.backend = RedisBackend(CONSTS.redis_url, CONSTS.response_cache_ttl)
+        elif backend:
+            raise ValueError(backend)
+
+    def _call(self, method, *args):
+        """Cache failures, like redis being down, should never take a page down with them."""
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            current_app.logger.warning(f"response cache {method} failed: {e!r}")
+            return None
+
+    @staticmethod
+    def is_cacheable_request():
+        return request.method == "GET" and "user_id" not in session and "_flashes" not in session
+
+    def cached(self, fn):
+        @wraps(fn)
+        def decorated_function(*args, **kwargs):
+            if not self.backend or not self.is_cacheable_request():
+                return fn(*args, **kwargs)
+
+            key = request.full_path
+            value = self._call("get", key)
+            if value:
+                self._call("incr", "hits")
+                mimetype, body = value.split(b"\n", 1)
+                if CSRF_PLACEHOLDER in body:
+                    body = body.replace(CSRF_PLACEHOLDER, generate_csrf().encode())
+                response = make_response(body)
+                response.mimetype = mimetype.decode()
+                response.headers.set("X-Cache", "HIT")
+                return response
+
+            self._call("incr", "misses")
+            response = make_response(fn(*args, **kwargs))
+
+            if response.status_code == 200 and not response.direct_passthrough and self.is_cacheable_request():
+                body = response.get_data()
+                csrf_token = g.get(current_app.config.get("WTF_CSRF_FIELD_NAME", "csrf_token"))
+                if csrf_token:
+                    body = body.replace(csrf_token.encode(), CSRF_PLACEHOLDER)
+                self._call("set", key, response.mimetype.encode() + b"\n" + body)
+                self._call("incr", "stores")
+
+            response.headers.set("X-Cache", "MISS")
+            return response
+
+        return decorated_function
+
+    def invalidate(self):
+        touch_stamp()
+        if self.backend:
+            self._call("clear")
+            self._call("incr", "invalidations")
+
+    @staticmethod
+    def generation():
+        """Changes on every `invalidate()`, in any process. For caches kept outside of this one, like the feeds."""
+        return read_stamp()
+
+    def stats(self):
+        if not self.backend:
+            return {}
+        return self._call("stats") or {}
+
+
+response_cache = ResponseCache()
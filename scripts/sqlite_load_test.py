@@ -0,0 +1,82 @@
+"""
+Concurrent read/write throughput of a fresh sqlite database, with sqlite's default pragmas and with `CONSTS.sqlite_pragmas`.
+Writer processes insert log rows and reader processes count and list them, like logged requests and /admin_logs.
+
+    python scripts/sqlite_load_test.py --seconds 5 --writers 2 --readers 4
+
+The databases are temporary, the site's database is never touched.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.exc import OperationalError
+
+from models import Log, apply_sqlite_pragmas, db
+
+
+def make_engine(db_path, tuned):
+    engine = create_engine(f"sqlite:///{db_path}")
+    if tuned:
+        apply_sqlite_pragmas(engine)
+    return engine
+
+
+def worker(db_path, tuned, kind, seconds, results):
+    engine = make_engine(db_path, tuned)
+    done = 0
+    errors = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        try:
+            with engine.begin() as connection:
+                if kind == "write":
+                    connection.execute(insert(Log), [{"path": "/load_test", "method": "GET", "status": 200}])
+                else:
+                    connection.execute(select(func.count(Log.id))).scalar()
+                    connection.execute(select(Log).order_by(Log.id.desc()).limit(30)).all()
+            done += 1
+        except OperationalError:
+            # "database is locked", once busy_timeout (if any) runs out
+            errors += 1
+    results.put((kind, done, errors))
+
+
+def run(tuned, seconds, writers, readers):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "load_test.db")
+        engine = make_engine(db_path, tuned)
+        db.metadata.create_all(engine)
+        engine.dispose()
+
+        results = multiprocessing.Queue()
+        kinds = ["write"] * writers + ["read"] * readers
+        processes = [multiprocessing.Process(target=worker, args=(db_path, tuned, kind, seconds, results)) for kind in kinds]
+        for process in processes:
+            process.start()
+        counts = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    writes = sum(done for kind, done, _ in counts if kind == "write")
+    reads = sum(done for kind, done, _ in counts if kind == "read")
+    errors = sum(errors for _, _, errors in counts)
+    return writes / seconds, reads / seconds, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+
+    for name, tuned in [("default pragmas", False), ("CONSTS.sqlite_pragmas", True)]:
+        writes, reads, errors = run(tuned, args.seconds, args.writers, args.readers)
+        print(f"{name:>22}: {writes:>7.0f} writes/s {reads:>7.0f} reads/s {errors:>5} locked errors")
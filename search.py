@@ -0,0 +1,94 @@
+from markupsafe import Markup, escape
+from sqlalchemy import DateTime, Integer, String, select, text
+from sqlalchemy.orm import selectinload, undefer
+
+from models import Post
+
+# Markers for the matched terms in snippets, swapped for <mark> once the snippet is escaped.
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+_index_exists = False
+
+
+def create_search_index(connection):
+    """The FTS5 table mirrors each post's title, markdown and tags, with `rowid` = `post.id`."""
+    connection.execute(
+        text("CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(title, text_markdown, tags, tokenize='porter unicode61')")
+    )
+
+
+def _ensure_search_index(session):
+    global _index_exists
+    if not _index_exists:
+        create_search_index(session.connection())
+        _index_exists = True
+
+
+def index_post(session, post: Post):
+    """Add or replace `post` in the search index. `post` needs an id, so flush new posts first."""
+    _ensure_search_index(session)
+    unindex_post(session, post.id)
+    session.execute(
+        text("INSERT INTO post_fts (rowid, title, text_markdown, tags) VALUES (:id, :title, :text_markdown, :tags)"),
+        {"id": post.id, "title": post.title, "text_markdown": post.text_markdown, "tags": " ".join(t.text for t in post.tags)},
+    )
+
+
+def unindex_post(session, post_id):
+    _ensure_search_index(session)
+    session.execute(text("DELETE FROM post_fts WHERE rowid = :id"), {"id": post_id})
+
+
+def rebuild_search_index(session):
+    """Re-index every post. Returns the number of posts indexed."""
+    _ensure_search_index(session)
+    session.execute(text("DELETE FROM post_fts"))
+    posts = session.scalars(select(Post).options(undefer(Post.text_markdown), selectinload(Post.tags))).all()
+    for post in posts:
+        index_post(session, post)
+    return len(posts)
+
+
+def to_fts_query(query):
+    """Quote every term, so user input is never parsed as FTS5 query syntax. All terms must match."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def search_posts(session, query, page, page_size, include_unpublished=False):
+    """
+    Return a page of posts matching `query`, best match first, and whether there is a next page.
+    Title matches rank above tag matches, which rank above body matches.
+    """
+    fts_query = to_fts_query(query)
+    if not fts_query:
+        return [], False
+
+    _ensure_search_index(session)
+    rows = session.execute(
+        text(
+            f"""
+            SELECT post.id, post.title, post.path, post.published_date,
+                snippet(post_fts, -1, :start, :end, '...', 24) AS snippet
+            FROM post_fts
+            JOIN post ON post.id = post_fts.rowid
+            WHERE post_fts MATCH :query
+            {"" if include_unpublished else "AND post.is_published = 1"}
+            ORDER BY bm25(post_fts, 10.0, 1.0, 5.0)
+            LIMIT :limit OFFSET :offset
+            """
+        ).columns(id=Integer, title=String, path=String, published_date=DateTime, snippet=String),
+        {"start": MATCH_START, "end": MATCH_END, "query": fts_query, "limit": page_size + 1, "offset": (page - 1) * page_size},
+    ).all()
+
+    results = [
+        {
+            "id": row.id,
+            "title": row.title,
+            "path": row.path,
+            "published_date": row.published_date,
+            "snippet": Markup(str(escape(row.snippet)).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")),
+        }
+        for row in rows[:page_size]
+    ]
+    return results, len(rows) > page_size
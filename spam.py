@@ -0,0 +1,90 @@
+import ipaddress
+
+from configs import CONSTS
+
+
+def normalize(text):
+    return text.lower().replace("'", "")
+
+
+class SpamFilter:
+    """
+    Scores messages by the weights of the phrases they contain, and blocks senders by network.
+    Phrases and networks are prepared once, so checking a message is one substring scan per phrase,
+    heaviest phrases first, stopping as soon as the threshold is reached.
+    """
+
+    def __init__(self, phrases: dict, threshold, blocked_networks=()):
+        for phrase, weight in phrases.items():
+            if weight <= 0:
+                raise ValueError(f"weights must be positive, {phrase!r} has {weight}")
+
+        # normalized like the messages, so e.g. a capitalized site name still matches
+        weights = {normalize(phrase): weight for phrase, weight in phrases.items()}
+        self.phrases = tuple(sorted(weights.items(), key=lambda item: item[1], reverse=True))
+
+        self.threshold = threshold
+        self.blocked_networks = tuple(ipaddress.ip_network(network, strict=False) for network in blocked_networks)
+
+    def is_blocked_ip(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(address in network for network in self.blocked_networks)
+
+    def score(self, text):
+        text = normalize(text)
+        return sum(weight for phrase, weight in self.phrases if phrase in text)
+
+    def is_spam(self, text, ip=None):
+        if ip and self.is_blocked_ip(ip):
+            return True
+
+        text = normalize(text)
+        points = 0
+        for phrase, weight in self.phrases:
+            if phrase in text:
+                points += weight
+                if points >= self.threshold:
+                    return True
+        return False
+
+
+spam_filter = SpamFilter(CONSTS.spam_phrases, CONSTS.spam_threshold, CONSTS.spam_blocked_networks)
+
+
+if __name__ == "__main__":
+    import random
+    import re
+    from timeit import timeit
+
+    random.seed(0)
+    words = "the quick brown fox jumps over a lazy dog thanks for this great post I really enjoyed reading it".split()
+    corpus = [
+        " ".join(random.choice(words) for _ in range(random.randint(10, 300))) + random.choice(["", "", " Best regards", " free shipping"])
+        for _ in range(10000)
+    ]
+
+    def is_spam_uncompiled(text):
+        """How `main.comment_is_spam` scored messages, rebuilding its phrases on every call."""
+        phrases = dict(CONSTS.spam_phrases)
+        points = 0
+        text = text.lower().replace("'", "")
+        for phrase in phrases:
+            if phrase in text:
+                points += phrases[phrase]
+        return points >= CONSTS.spam_threshold
+
+    combined = re.compile("(?=(" + "|".join(re.escape(phrase) for phrase, _ in sorted(spam_filter.phrases, key=lambda item: -len(item[0]))) + "))")
+    weights = dict(spam_filter.phrases)
+
+    def is_spam_combined_regex(text):
+        """A single pass with every phrase in one regex. Phrases contained in longer matches would still need adding."""
+        return sum(weights[phrase] for phrase in set(combined.findall(normalize(text)))) >= CONSTS.spam_threshold
+
+    assert [spam_filter.is_spam(text) for text in corpus] == [is_spam_uncompiled(text) for text in corpus]
+
+    for name, fn in [("uncompiled", is_spam_uncompiled), ("combined regex", is_spam_combined_regex), ("SpamFilter", spam_filter.is_spam)]:
+        seconds = timeit(lambda: [fn(text) for text in corpus], number=5) / 5
+        print(f"{name:>15}: {len(corpus) / seconds:,.0f} messages/s")
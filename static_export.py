@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import shutil
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+
+from configs import CONSTS
+from models import BridgeTag, Comment, File, FileVariant, Post, Tag, db
+
+MANIFEST_FILE = ".export_manifest.json"
+
+
+def export_file_path(output_dir, url, extension="html"):
+    """`/post/abc` -> `<output_dir>/post/abc/index.html`, so a web server can map each url onto its directory."""
+    return os.path.join(output_dir, url.strip("/"), f"index.{extension}")
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"posts": {}}
+
+
+def save_manifest(output_dir, manifest):
+    write_file(os.path.join(output_dir, MANIFEST_FILE), json.dumps(manifest, indent=2).encode())
+
+
+def get_post_versions():
+    """
+    Return `{path: version}` for the published posts, the version being a digest of what their page shows:
+    the markdown and the renderer it went through, the title and dates, the tags, the files and their variants,
+    and the comments. Edits don't move `last_modified_date`, so it can't tell on its own.
+    """
+    posts = db.session.execute(
+        select(Post.id, Post.path, Post.title, Post.text_markdown_hash, Post.text_html_renderer, Post.published_date, Post.last_modified_date)
+        .where(Post.is_published == True)
+    ).all()
+    paths = {post_id: path for post_id, path, *_ in posts}
+    contents = {post_id: {"post": list(row), "tags": [], "files": [], "comments": None} for post_id, *row in posts}
+
+    for post_id, tag_id, tag_text in db.session.execute(
+        select(BridgeTag.post_id, Tag.id, Tag.text).join(Tag, Tag.id == BridgeTag.tag_id).order_by(BridgeTag.post_id, Tag.id)
+    ):
+        if post_id in contents:
+            contents[post_id]["tags"].append([tag_id, tag_text])
+
+    for post_id, *file in db.session.execute(
+        select(File.post_id, File.id, File.file_name, File.server_file_name, File.blob_hash, func.count(FileVariant.id))
+        .outerjoin(FileVariant, FileVariant.file_id == File.id)
+        .group_by(File.id)
+        .order_by(File.id)
+    ):
+        if post_id in contents:
+            contents[post_id]["files"].append(file)
+
+    for post_id, *comments in db.session.execute(
+        select(Comment.post_id, func.count(Comment.id), func.max(Comment.published_date)).group_by(Comment.post_id)
+    ):
+        if post_id in contents:
+            contents[post_id]["comments"] = comments
+
+    return {paths[post_id]: hashlib.sha1(json.dumps(content, default=str).encode()).hexdigest() for post_id, content in contents.items()}
+
+
+@click.command("export")
+@click.argument("output_dir", type=click.Path(file_okay=False))
+@click.option("--full", is_flag=True, help="Re-export every post, not only those changed since the last export.")
+@with_appcontext
+def export_site(output_dir, full):
+    """
+    Render the public site into OUTPUT_DIR as static files, e.g. `flask --app main export /var/www/blog`.
+
+    Pages are rendered through the app itself, as an anonymous visitor, so they match what the app serves.
+    A post is re-exported when anything its page shows changed since the previous export, see `get_post_versions`.
+    The index, the first page of the post list, the tag pages and the feeds are re-exported on every run.
+    Urls are made absolute, e.g. in the feeds, against `CONSTS.site_url`.
+    Forms on exported pages fetch their captcha and csrf token from the app, so `/captcha` and
+    POSTs must still be proxied to it, along with anything not found on disk (e.g. older post list pages).
+    """
+    output_dir = os.path.abspath(output_dir)
+    manifest = {"posts": {}} if full else load_manifest(output_dir)
+    client = current_app.test_client()
+
+    def export(url, extension="html"):
+        response = client.get(url, base_url=CONSTS.site_url)
+        if response.status_code != 200:
+            click.echo(f"Skipped {url}, got {response.status_code}.", err=True)
+            return False
+        write_file(export_file_path(output_dir, url, extension), response.get_data())
+        return True
+
+    # for url_for, the pages themselves are requested through `client`
+    with current_app.test_request_context(base_url=CONSTS.site_url):
+        posts = get_post_versions()
+
+        exported_posts = {}
+        changed = 0
+        for path, version in posts.items():
+            if manifest["posts"].get(path) == version:
+                exported_posts[path] = version
+                continue
+
+            if export(url_for("bp_post.post_read_path", post_path=path)):
+                exported_posts[path] = version
+                changed += 1
+
+        removed = set(manifest["posts"]) - set(exported_posts)
+        for path in removed:
+            post_dir = os.path.dirname(export_file_path(output_dir, url_for("bp_post.post_read_path", post_path=path)))
+            shutil.rmtree(post_dir, ignore_errors=True)
+
+        export(url_for("index"))
+        export(url_for("bp_post.post_list"))
+        export(url_for("rss"), "xml")
+        export(url_for("atom"), "xml")
+
+        for tag_id in db.session.scalars(select(Tag.id)):
+            export(url_for("bp_tag.tag_list", tag_id=tag_id))
+            export(url_for("tag_rss", tag_id=tag_id), "xml")
+            export(url_for("tag_atom", tag_id=tag_id), "xml")
+
+        manifest["posts"] = exported_posts
+        save_manifest(output_dir, manifest)
+        click.echo(f"Exported {changed} of {len(posts)} posts, removed {len(removed)}, to {output_dir}.")
@@ -0,0 +1,109 @@
+import importlib.util
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if not os.path.exists(os.path.join(ROOT, "configs.py")):
+    # a fresh checkout runs against the defaults
+    spec = importlib.util.spec_from_file_location("configs", os.path.join(ROOT, "configs_COPY.py"))
+    configs = importlib.util.module_from_spec(spec)
+    sys.modules["configs"] = configs
+    try:
+        spec.loader.exec_module(configs)
+    except FileNotFoundError as e:
+        pytest.exit(f"{e}, see Site Configurations in README.md.")
+
+from configs import CONSTS
+
+# Everything the tests write goes here, never to the site's database or cache stamp.
+TMP_DIR = tempfile.mkdtemp(prefix="blogger_tests_")
+
+CONSTS.DATABASE_FILE = os.path.join(TMP_DIR, "test.db")
+CONSTS.SQLALCHEMY_DATABASE_URI = "sqlite:///" + CONSTS.DATABASE_FILE
+CONSTS.UPLOADS_FULL_PATH = os.path.join(TMP_DIR, "uploads")
+os.mkdir(CONSTS.UPLOADS_FULL_PATH)
+CONSTS.redis_url = "memory://"
+CONSTS.store_requests = False
+CONSTS.response_cache_backend = "memory"
+# the app tests don't need pandoc installed, test_renderer_parity.py compares the two renderers directly
+CONSTS.markdown_renderer = "markdown-it"
+
+import response_cache  # noqa: E402
+
+response_cache.STAMP_FILE = os.path.join(TMP_DIR, "response_cache.stamp")
+
+
+@pytest.fixture(scope="session")
+def app():
+    from init_database import build_db
+    from main import app
+
+    app.config.update(RATELIMIT_ENABLED=False)
+    with app.app_context():
+        build_db()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(app):
+    from models import User, db
+    from sqlalchemy import select
+
+    client = app.test_client()
+    with app.app_context():
+        admin_id = db.session.scalar(select(User.id).where(User.username == CONSTS.admin_username))
+    with client.session_transaction() as session:
+        session["user_id"] = admin_id
+    return client
+
+
+class QueryCounter:
+    """Records the statements `engine` runs inside the `with` block."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return False
+
+
+@pytest.fixture
+def assert_max_queries(app):
+    """`with assert_max_queries(n):` fails when the block runs more than `n` statements, listing them."""
+    from models import db
+
+    with app.app_context():
+        engine = db.engine
+
+    @contextmanager
+    def assert_max_queries(budget):
+        with QueryCounter(engine) as counter:
+            yield counter
+        assert counter.count <= budget, f"{counter.count} statements, over the budget of {budget}:\n" + "\n".join(counter.statements)
+
+    return assert_max_queries
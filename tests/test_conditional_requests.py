@@ -0,0 +1,63 @@
+"""Readers that only send If-Modified-Since, as many feed fetchers do, must see edits."""
+import os
+
+from sqlalchemy import select, update
+
+import response_cache as response_cache_module
+from models import Post, User, db
+from response_cache import response_cache
+
+
+def edit_post(app, post_id, text_markdown):
+    """Edit a post the way `post_edit` does: its last_modified_date stays, and the cache is invalidated."""
+    with app.app_context():
+        db.session.execute(update(Post).where(Post.id == post_id).values(text_markdown=text_markdown, text_html=f"<p>{text_markdown}</p>"))
+        db.session.commit()
+    response_cache.invalidate()
+    # Last-Modified has one second precision, so make the edit land in a later second than the first request
+    stamp = os.stat(response_cache_module.STAMP_FILE).st_mtime_ns + 2_000_000_000
+    os.utime(response_cache_module.STAMP_FILE, ns=(stamp, stamp))
+
+
+def test_feed_last_modified_moves_on_edit(app, client):
+    with app.app_context():
+        user_id = db.session.scalar(select(User.id))
+        post = Post(title="Feed post", path="feed_post", text_markdown="before", text_html="<p>before</p>", user_id=user_id)
+        db.session.add(post)
+        db.session.commit()
+        post_id = post.id
+    response_cache.invalidate()
+
+    response = client.get("/rss")
+    assert response.status_code == 200
+    assert response.last_modified
+
+    if_modified_since = response.headers["Last-Modified"]
+    assert client.get("/rss", headers={"If-Modified-Since": if_modified_since}).status_code == 304
+
+    edit_post(app, post_id, "after")
+    assert client.get("/rss", headers={"If-Modified-Since": if_modified_since}).status_code == 200
+
+
+def test_post_page_revalidates_by_etag_only(app, client):
+    with app.app_context():
+        user_id = db.session.scalar(select(User.id))
+        post = Post(title="Etag post", path="etag_post", text_markdown="before", text_html="<p>before</p>", user_id=user_id)
+        db.session.add(post)
+        db.session.commit()
+        post_id = post.id
+    response_cache.invalidate()
+
+    response = client.get("/post/etag_post")
+    assert response.status_code == 200
+    assert response.last_modified is None
+    etag = response.headers["ETag"]
+    assert client.get("/post/etag_post", headers={"If-None-Match": etag}).status_code == 304
+
+    # a date alone never validates the page
+    assert client.get("/post/etag_post", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}).status_code == 200
+
+    edit_post(app, post_id, "after")
+    response = client.get("/post/etag_post", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert b"after" in response.data
@@ -0,0 +1,27 @@
+from sqlalchemy import select
+
+import feeds
+from configs import CONSTS
+from models import Post, User, db
+from response_cache import response_cache
+
+
+def test_feed_links_and_cache_ignore_the_request_host(app, client):
+    with app.app_context():
+        user_id = db.session.scalar(select(User.id))
+        db.session.add(Post(title="Host post", path="host_post", text_markdown="text", text_html="<p>text</p>", user_id=user_id))
+        db.session.commit()
+    response_cache.invalidate()
+
+    for i in range(5):
+        for headers in ({"Host": f"host{i}.example"}, {"X-Forwarded-Host": f"forwarded{i}.example"}):
+            body = client.get("/rss", headers=headers).get_data(as_text=True)
+            assert f"<link>{CONSTS.site_url}/post/host_post</link>" in body
+            assert "example" not in body
+    assert list(feeds._feeds) == [("rss", None)]
+
+    # entries from before an invalidation are dropped once any feed is rebuilt
+    client.get("/atom")
+    response_cache.invalidate()
+    client.get("/rss")
+    assert list(feeds._feeds) == [("rss", None)]
@@ -0,0 +1,72 @@
+"""
+Statement budgets for the public views. They don't grow with the number of posts, tags, comments or files,
+so a relationship that starts lazy loading per row (an N+1) pushes a view over its budget.
+"""
+import pytest
+from flask import url_for
+
+from models import Comment, File, FileVariant, Post, Tag, User, db
+from response_cache import response_cache
+from sqlalchemy import select
+
+POSTS = 10
+
+
+@pytest.fixture(scope="module")
+def posts(app):
+    with app.app_context():
+        admin = db.session.scalar(select(User).where(User.role == 1))
+        tags = [Tag(text="budget"), Tag(text="budget2")]
+        posts = []
+        for i in range(POSTS):
+            post = Post(
+                title=f"Budget post {i}",
+                path=f"budget_post_{i}",
+                text_markdown=f"Post {i}",
+                text_html=f"<p>Post {i}</p>",
+                is_published=True,
+                user=admin,
+                tags=tags,
+                comments=[Comment(title=f"comment {j}", text="text") for j in range(2)],
+                files=[
+                    File(
+                        file_name=f"{i}.png",
+                        relative_path="static/uploads",
+                        server_file_name=f"budget_{i}.png",
+                        variants=[FileVariant(server_file_name=f"budget_{i}_320w.webp", file_type="webp", width=320, height=240)],
+                    )
+                ],
+            )
+            posts.append(post)
+        db.session.add_all(posts)
+        db.session.commit()
+        return {"path": posts[0].path, "tag_id": tags[0].id}
+
+
+@pytest.fixture
+def get_uncached(app, client):
+    """GET `endpoint` as an anonymous visitor, rendered rather than served from the response cache."""
+
+    def get_uncached(endpoint, **values):
+        with app.test_request_context():
+            url = url_for(endpoint, **values)
+        response_cache.invalidate()
+        return client.get(url)
+
+    return get_uncached
+
+
+@pytest.mark.parametrize(
+    "endpoint, values, budget",
+    [
+        ("index", {}, 2),
+        ("bp_post.post_list", {}, 2),
+        ("bp_tag.tag_list", {"tag_id": "tag_id"}, 3),
+        ("bp_post.post_read_path", {"post_path": "path"}, 6),
+    ],
+)
+def test_query_budget(posts, get_uncached, assert_max_queries, endpoint, values, budget):
+    values = {name: posts[key] for name, key in values.items()}
+    with assert_max_queries(budget):
+        response = get_uncached(endpoint, **values)
+    assert response.status_code == 200
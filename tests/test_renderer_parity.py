@@ -0,0 +1,117 @@
+"""
+Output parity between the markdown-it and pandoc renderers, so switching `CONSTS.markdown_renderer`
+doesn't change how stored `Post.text_html` looks. The html is compared after `normalize_html`.
+Known differences are strict xfails: once the markdown-it renderer matches pandoc, they fail, and move to `SAME`.
+"""
+import re
+import shutil
+from html.parser import HTMLParser
+
+import pytest
+
+from configs import CONSTS
+from pandoc_pool import run_pandoc
+from renderer import MarkdownItRenderer
+
+PANDOC_PATH = shutil.which(CONSTS.pandoc_path) or shutil.which("pandoc")
+
+pytestmark = pytest.mark.skipif(not PANDOC_PATH, reason=f"pandoc is not installed at {CONSTS.pandoc_path} or on PATH")
+
+# attributes pandoc adds that change nothing on the page, and markdown-it's empty alt for images without alt text
+IGNORED_ATTRIBUTES = {("a", "class", "uri"), ("ol", "type", "1"), ("img", "alt", "")}
+
+
+class _Normalizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tokens = []
+        self.code = None  # the text of the highlighted code block being read
+
+    def handle_starttag(self, tag, attrs):
+        if self.code is not None:
+            return
+
+        classes = dict(attrs).get("class") or ""
+        if classes.startswith("sourceCode"):
+            # pandoc adds ids and names languages its own way, e.g. "js" and "javascript"
+            attrs = [("class", "sourceCode")]
+            if tag == "code":
+                self.code = ""
+        attrs = sorted((name, value) for name, value in attrs if (tag, name, value) not in IGNORED_ATTRIBUTES)
+        self.tokens.append(("start", tag, attrs))
+
+    def handle_endtag(self, tag):
+        if self.code is not None:
+            if tag != "code":
+                return
+            self.tokens.append(("data", self.code.strip()))
+            self.code = None
+        self.tokens.append(("end", tag))
+
+    def handle_data(self, data):
+        if self.code is not None:
+            self.code += data
+            return
+
+        data = re.sub(r"\s+", " ", data).strip()
+        if data:
+            self.tokens.append(("data", data))
+
+
+def normalize_html(html):
+    """
+    Tags, attributes and text, ignoring entity encoding, whitespace between and around text, and `IGNORED_ATTRIBUTES`.
+    Highlighted code is compared by its text, pygments and pandoc's skylighting split it into different spans.
+    """
+    parser = _Normalizer()
+    parser.feed(html)
+    parser.close()
+    return parser.tokens
+
+
+def render_both(markdown_text):
+    markdown_it_html = MarkdownItRenderer().to_html(markdown_text)
+    pandoc_html = run_pandoc(markdown_text, "markdown", "html+raw_html", PANDOC_PATH)
+    return normalize_html(markdown_it_html), normalize_html(pandoc_html)
+
+
+SAME = {
+    "emphasis": "Hello *world* and **bold** text.\n\nSecond paragraph with `code`.",
+    "heading ids": "# Intro\n\nText\n\n## Getting Started!\n\n## Intro\n\n### 2024 recap\n",
+    "lists": "- one\n- two\n  - nested\n\n1. first\n2. second\n",
+    "links": "A [link](https://example.com), an <https://example.org/auto> and [another](/post/other \"title\").",
+    "indented code": "Before\n\n    indented code\n    block\n\nAfter",
+    "blockquote": "> quoted\n> text\n>\n> second paragraph\n",
+    "table": "| a | b |\n|---|---|\n| 1 | 2 |\n| 3 | 4 |\n",
+    "strikethrough": "~~gone~~ text",
+    "raw html": '<div class="note">raw <b>html</b></div>\n\nafter\n\n<iframe src="https://example.com/embed"></iframe>\n',
+    "inline image": "text ![alt](/static/uploads/x.png) more",
+    "horizontal rule": "a\n\n---\n\nb",
+    "fenced code": "```python\nprint('hi')\n\ndef f(x):\n    return x * 2\n```\n\n```\nplain\n```\n\n```not-a-language\nx\n```\n",
+    "image paragraph": '![alt *text*](/static/uploads/x.png "title")\n\n![](/static/uploads/no_alt.png)\n\n[![linked](/x.png)](/y)',
+    "smart punctuation": '"Quoted" -- and --- it\'s \'single\'... (c) +- x--y d.. e....',
+    "post": (
+        "# A post\n\nSome *intro* with a [link](https://example.com).\n\n"
+        "## Steps\n\n1. install\n2. run `main.py`\n\n> a quote\n\n| key | value |\n|-----|-------|\n| a | 1 |\n"
+    ),
+}
+
+DIFFERENT = {
+    "footnotes": ("Text[^1].\n\n[^1]: Note.", "markdown-it-py's footnotes are a plugin package, which isn't a dependency"),
+}
+
+
+@pytest.mark.parametrize("markdown_text", SAME.values(), ids=SAME.keys())
+def test_same_html(markdown_text):
+    markdown_it_tokens, pandoc_tokens = render_both(markdown_text)
+    assert markdown_it_tokens == pandoc_tokens
+
+
+@pytest.mark.parametrize(
+    "markdown_text",
+    [pytest.param(markdown_text, marks=pytest.mark.xfail(reason=reason, strict=True)) for markdown_text, reason in DIFFERENT.values()],
+    ids=DIFFERENT.keys(),
+)
+def test_documented_differences(markdown_text):
+    markdown_it_tokens, pandoc_tokens = render_both(markdown_text)
+    assert markdown_it_tokens == pandoc_tokens
@@ -0,0 +1,20 @@
+from sqlalchemy import func, select
+
+from models import Post, db
+from search import rebuild_search_index, search_posts
+
+
+def test_rebuild_search_index(app, assert_max_queries):
+    with app.app_context():
+        db.session.add(Post(title="Rebuild me", path="rebuild_me", text_markdown="zebra crossing", user_id=1))
+        db.session.commit()
+        posts = db.session.scalar(select(func.count(Post.id)))
+
+        # create the index if this process hasn't, clear it, read the posts with their markdown and tags,
+        # then a delete and an insert per post
+        with assert_max_queries(4 + 2 * posts):
+            assert rebuild_search_index(db.session) == posts
+        db.session.commit()
+
+        results, _ = search_posts(db.session, "zebra", 1, 10)
+        assert [post["title"] for post in results] == ["Rebuild me"]
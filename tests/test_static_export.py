@@ -0,0 +1,73 @@
+import os
+
+from sqlalchemy import select
+
+from configs import CONSTS
+from models import Post, User, db
+from renderer import render_post
+from response_cache import response_cache
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def edit_post(client, post_id, published_date, text_markdown):
+    """Edit through the form, which keeps last_modified_date at the date it shows."""
+    response = client.post(
+        f"/post_edit/{post_id}",
+        data={
+            "csrf_token": client.get("/captcha").json["csrf_token"],
+            "title": "Exported post",
+            "text_markdown": text_markdown,
+            "tags": "",
+            "published_date": published_date.strftime("%Y-%m-%d"),
+            "last_modified_date": published_date.strftime("%Y-%m-%d"),
+            "is_published": "y",
+        },
+    )
+    assert response.status_code == 302
+
+
+def test_export_rewrites_edited_post(app, admin_client, tmp_path):
+    with app.app_context():
+        post = Post(title="Exported post", path="exported_post", user_id=db.session.scalar(select(User.id)))
+        render_post(post, "first version")
+        db.session.add(post)
+        db.session.commit()
+        post_id, published_date = post.id, post.published_date
+    response_cache.invalidate()
+
+    runner = app.test_cli_runner()
+    post_file = tmp_path / "post" / "exported_post" / "index.html"
+
+    edit_post(admin_client, post_id, published_date, "second version")
+    result = runner.invoke(args=["export", str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    assert "second version" in read(post_file)
+
+    result = runner.invoke(args=["export", str(tmp_path)])
+    assert "Exported 0 of" in result.output
+
+    edit_post(admin_client, post_id, published_date, "third version")
+    result = runner.invoke(args=["export", str(tmp_path)])
+    assert "Exported 1 of" in result.output
+    assert "third version" in read(post_file)
+
+
+def test_export_feed_links_point_to_site(app, tmp_path):
+    with app.app_context():
+        post = Post(title="Feed link post", path="feed_link_post", user_id=db.session.scalar(select(User.id)))
+        render_post(post, "text")
+        db.session.add(post)
+        db.session.commit()
+    response_cache.invalidate()
+
+    result = app.test_cli_runner().invoke(args=["export", str(tmp_path)])
+    assert result.exit_code == 0, result.output
+
+    for feed in ("rss", "atom"):
+        body = read(os.path.join(tmp_path, feed, "index.xml"))
+        assert f"{CONSTS.site_url}/post/feed_link_post" in body
+        assert "localhost" not in body
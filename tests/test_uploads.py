@@ -0,0 +1,39 @@
+import hashlib
+import os
+
+import pytest
+
+from uploads import BLOB_PATH_RE, get_blob_path, get_variant_path
+
+BLOB_HASH = hashlib.sha256(b"image").hexdigest()
+
+
+@pytest.fixture
+def blob(app):
+    """A stored upload and one of its variants, as `(server_file_name, variant_file_name)`."""
+    server_file_name = get_blob_path(BLOB_HASH, "png")
+    variant_file_name = get_variant_path(server_file_name, 320, "webp")
+    for file_name in (server_file_name, variant_file_name):
+        path = os.path.join(app.config["UPLOADS_FULL_PATH"], file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"image")
+    return server_file_name, variant_file_name
+
+
+def test_blob_path_re():
+    assert BLOB_PATH_RE.match(f"ab/cd/{BLOB_HASH}.png")["blob_hash"] == BLOB_HASH
+    match = BLOB_PATH_RE.match(f"ab/cd/{BLOB_HASH}_320w.webp")
+    assert (match["blob_hash"], match["variant"]) == (BLOB_HASH, "_320w")
+    assert not BLOB_PATH_RE.match("legacy_upload.png")
+    assert not BLOB_PATH_RE.match(f"ab/cd/{BLOB_HASH}_thumb.webp")
+
+
+def test_blobs_and_variants_are_immutable(client, blob):
+    server_file_name, variant_file_name = blob
+    for file_name, etag in [(server_file_name, BLOB_HASH), (variant_file_name, f"{BLOB_HASH}_320w")]:
+        response = client.get(f"/static/uploads/{file_name}")
+        assert response.status_code == 200
+        assert response.cache_control.immutable
+        assert response.cache_control.max_age == 365 * 24 * 60 * 60
+        assert response.get_etag() == (etag, False)
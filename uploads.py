@@ -0,0 +1,226 @@
+import glob
+import hashlib
+import mimetypes
+import os
+import re
+import secrets
+
+from flask import abort, current_app, flash, send_from_directory
+from sqlalchemy import select
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+
+from configs import CONSTS
+from models import File, db
+
+# Uploads are copied to disk this many bytes at a time, so a worker never holds a whole file in memory.
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# `get_blob_path` names, and the `get_variant_path` names of their image variants, whose content can never change
+BLOB_PATH_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/(?P<blob_hash>[0-9a-f]{64})(?P<variant>_\d+w)?(\.\w+)?$")
+
+BLOB_MAX_AGE = 365 * 24 * 60 * 60
+
+# what `get_variant_path` appends to an upload's name, minus its extension
+VARIANT_SUFFIX_RE = re.compile(r"_\d+w\.\w+")
+
+
+class UploadError(Exception):
+    pass
+
+
+def get_file_extension(file_name):
+    return os.path.splitext(file_name)[1].lstrip(".").lower()
+
+
+def get_blob_path(blob_hash, extension):
+    """Relative to `UPLOADS_FULL_PATH`, and a url path, sharded so no directory grows past 256 entries per level."""
+    file_name = f"{blob_hash}.{extension}" if extension else blob_hash
+    return f"{blob_hash[:2]}/{blob_hash[2:4]}/{file_name}"
+
+
+def get_variant_path(server_file_name, width, extension):
+    """Where `images.py` writes a `width` pixels wide `extension` copy of an upload, next to it."""
+    return f"{os.path.splitext(server_file_name)[0]}_{width}w.{extension}"
+
+
+def copy_stream(stream, f, max_size=None, chunk_size=UPLOAD_CHUNK_SIZE) -> str:
+    """
+    Copy `stream` to the file `f` in `chunk_size` pieces and return the sha256 of the content.
+    Raises `UploadError` once more than `max_size` bytes are read.
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    while chunk := stream.read(chunk_size):
+        size += len(chunk)
+        if max_size and size > max_size:
+            raise UploadError(f"larger than the {max_size // (1024 * 1024)} MB limit")
+        sha256.update(chunk)
+        f.write(chunk)
+    return sha256.hexdigest()
+
+
+def hash_file(path, chunk_size=UPLOAD_CHUNK_SIZE) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def store_upload(stream, extension, max_size=None):
+    """
+    Store `stream` under its content hash and return `(blob_hash, server_file_name)`.
+    The upload is streamed to a temp file that is renamed into place once complete, so a partial file
+    is never served. If the same content was uploaded before, the temp file is dropped and the blob shared.
+    """
+    uploads_dir = current_app.config["UPLOADS_FULL_PATH"]
+    tmp_path = os.path.join(uploads_dir, f".{secrets.token_hex(8)}.part")
+    try:
+        with open(tmp_path, "xb") as f:
+            blob_hash = copy_stream(stream, f, max_size)
+
+        server_file_name = get_blob_path(blob_hash, extension)
+        full_path = os.path.join(uploads_dir, server_file_name)
+        if os.path.isfile(full_path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(tmp_path, full_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return blob_hash, server_file_name
+
+
+def delete_upload(server_file_name):
+    """
+    Remove a stored upload, and its image variants, once no `File` row references it.
+    Call it after the rows are deleted and committed.
+    Returns whether the upload was removed.
+    """
+    if db.session.scalar(select(File.id).where(File.server_file_name == server_file_name).limit(1)):
+        return False
+
+    path = os.path.join(current_app.config["UPLOADS_FULL_PATH"], server_file_name)
+    stem = os.path.splitext(path)[0]
+    for variant_path in glob.glob(f"{glob.escape(stem)}_*w.*"):
+        if VARIANT_SUFFIX_RE.fullmatch(variant_path[len(stem):]):
+            os.remove(variant_path)
+
+    if os.path.isfile(path):
+        os.remove(path)
+        return True
+    return False
+
+
+def send_upload(server_file_name):
+    """
+    Serve an upload according to `CONSTS.upload_serving`.
+    "flask" streams it from the worker, answering conditional and Range requests, or has the
+    front server send it with `USE_X_SENDFILE`. "x-accel" hands it to nginx with an `X-Accel-Redirect`
+    to `CONSTS.x_accel_uploads_location`, so no worker is tied up streaming large media.
+    Content-addressed blobs and their variants are cached for a year as immutable, with their hash,
+    plus the variant's width suffix, as the ETag.
+    """
+    match = BLOB_PATH_RE.match(server_file_name)
+    blob_etag = match["blob_hash"] + (match["variant"] or "") if match else None
+
+    if CONSTS.upload_serving == "x-accel":
+        path = safe_join(current_app.config["UPLOADS_FULL_PATH"], server_file_name)
+        if not path or not os.path.isfile(path):
+            abort(404)
+
+        response = current_app.response_class(mimetype=mimetypes.guess_type(server_file_name)[0] or "application/octet-stream")
+        response.headers.set("X-Accel-Redirect", f"{CONSTS.x_accel_uploads_location.rstrip('/')}/{server_file_name}")
+        if blob_etag:
+            response.set_etag(blob_etag)
+    elif CONSTS.upload_serving == "flask":
+        response = send_from_directory(
+            current_app.config["UPLOADS_FULL_PATH"],
+            server_file_name,
+            etag=blob_etag or True,
+            max_age=BLOB_MAX_AGE if blob_etag else None,
+        )
+        if not current_app.config["USE_X_SENDFILE"]:
+            # werkzeug answers Range requests, this tells media players they can seek
+            response.accept_ranges = "bytes"
+    else:
+        raise ValueError(CONSTS.upload_serving)
+
+    if blob_etag:
+        response.cache_control.public = True
+        response.cache_control.max_age = BLOB_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def upload_files_from_form(form):
+    """Save the form's uploads and return their `File` rows. Rejected files are flashed and skipped."""
+    files = []
+    for file in form.files.data:
+        file_name = secure_filename(file.filename)
+        if not file_name:
+            continue
+
+        extension = get_file_extension(file_name)
+        if extension not in CONSTS.supported_file_uploads:
+            flash(f"Skipped {file_name}, only {', '.join(CONSTS.supported_file_uploads)} files are supported.", "danger")
+            continue
+
+        file_type = file.content_type.split("/")[-1] if file.content_type else None
+
+        try:
+            blob_hash, server_file_name = store_upload(file.stream, extension, CONSTS.max_upload_file_size)
+        except UploadError as e:
+            flash(f"Skipped {file_name}, it is {e}.", "danger")
+            continue
+
+        files.append(
+            File(
+                file_name=file_name,
+                relative_path=current_app.config["UPLOADS_REL_PATH"],
+                server_file_name=server_file_name,
+                blob_hash=blob_hash,
+                file_type=file_type,
+            )
+        )
+    return files
+
+
+if __name__ == "__main__":
+    import io
+    import tempfile
+    import tracemalloc
+
+    class ZeroStream(io.RawIOBase):
+        """`size` zero bytes, generated as they're read, so the benchmark's input takes no memory itself."""
+
+        def __init__(self, size):
+            self.remaining = size
+
+        def readable(self):
+            return True
+
+        def readinto(self, b):
+            n = min(len(b), self.remaining)
+            b[:n] = bytes(n)
+            self.remaining -= n
+            return n
+
+    size = 256 * 1024 * 1024
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "upload")
+
+        tracemalloc.start()
+        with open(path, "wb") as f:
+            f.write(ZeroStream(size).read())
+        print(f"read(): peak {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.1f} MB for a {size // 1024 // 1024} MB upload")
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        with open(path, "wb") as f:
+            copy_stream(ZeroStream(size), f)
+        print(f"copy_stream(): peak {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.1f} MB for a {size // 1024 // 1024} MB upload")
+        tracemalloc.stop()
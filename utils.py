@@ -1,5 +1,8 @@
 import os
 import re
+import threading
+
+import pytz
 
 def make_path(*file_path):
     """Make a file path as though this file's directory is a root directory."""
@@ -9,3 +12,34 @@ def quote_path(text):
     text = re.sub(r'[^a-zA-Z0-9_ ]', '', text).lower()
     text = re.sub(r' +|_+', '_', text)
     return text
+
+def to_utc(dt, timezone_str):
+    """Dates are stored naive, as `timezone_str` wall time (see `get_current_datetime`). Returns `dt` as an aware UTC datetime."""
+    if dt.tzinfo is None:
+        dt = pytz.timezone(timezone_str).localize(dt)
+    return dt.astimezone(pytz.utc)
+
+
+class PerProcess:
+    """
+    The object `factory` made for the current process. Threads don't survive a fork, so forked processes,
+    e.g. gunicorn workers, each make their own on first use rather than inherit the parent's.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.value = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.value = self.factory()
+                    self.pid = os.getpid()
+        return self.value
+
+    def peek(self):
+        """The current process's object, without making one."""
+        return self.value if self.pid == os.getpid() else None